@@ -0,0 +1,169 @@
+"""
+A script to measure what running the simulation costs, without a server
+and without waiting for real time to pass between ticks.
+
+Loads a map (or generates a grid of rooms), puts heroes and monsters in
+it and runs the game's ticks back to back, on a virtual clock that is
+moved on by one game period per tick, as if the game was running for
+real. Runs with the same seed go the same way.
+
+Prints the results as JSON, for comparing between versions:
+ticks per second, tick times (p50/p99), the time spent in each phase
+of a tick, and the patch operations and bytes sent per tick.
+
+Usage:
+   python bench_sim.py [--map map.json | --grid 20x20] [--heroes N]
+                       [--monsters M] [--ticks K] [--seed S] [--store]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from clock import VirtualClock  # noqa
+from entity import Hero  # noqa
+from game import Game  # noqa
+
+
+def grid_map(width, height, door_ratio=0.5):
+    "Generate map data for a grid of rooms, some of them connected by doors."
+    rooms, connections = {}, {}
+    for x in range(width):
+        for y in range(height):
+            name = "r%d_%d" % (x, y)
+            rooms[name] = {"rect": {"x": x * 100, "y": y * 100, "width": 90, "height": 90}}
+            for nx, ny in ((x + 1, y), (x, y + 1)):
+                if nx < width and ny < height:
+                    other = "r%d_%d" % (nx, ny)
+                    rect = {"x": (x + nx) * 50 + 40, "y": (y + ny) * 50 + 40,
+                            "width": 10, "height": 10}
+                    connections["%s-%s" % (name, other)] = {
+                        "door": random.random() < door_ratio, "rooms": [name, other],
+                        "rect": rect}
+    return {"rooms": rooms, "connections": connections}
+
+
+def load_game(data, heroes=1, monsters=4, seed=0, store=False):
+    "Create a game from map data, and populate it."
+    random.seed(seed)
+    data = dict(data, _id="bench", entities=[])
+    game = Game("bench", data, level_options={"store": store}, clock=VirtualClock(),
+                seed=seed)
+    rooms = sorted(game.level.rooms)
+    game.level.add_entities(
+        [{"_id": "hero%d" % i, "is_hero": True, "room": random.choice(rooms)}
+         for i in range(heroes)] +
+        [{"_id": "monster%d" % i, "is_hero": False, "room": random.choice(rooms)}
+         for i in range(monsters)])
+    game.level.max_entities = heroes + monsters
+    game.level.spawn_probability = 0.1  # replace the monsters that die
+    game.level.journal.flush()
+    return game
+
+
+class FrameCounter(object):
+
+    "Takes the place of a listener queue, adding up the size of the frames."
+
+    def __init__(self):
+        self.bytes = 0
+
+    def put(self, frame):
+        self.bytes += len(frame)
+
+
+def timed(totals, phase, function):
+    "Wrap a function so that the time spent in it is added up."
+    def wrapper(*args, **kwargs):
+        t0 = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[phase] += time.time() - t0
+    return wrapper
+
+
+def percentile(values, p):
+    "The value below which a fraction 'p' of the (sorted) values are."
+    return values[int(round(p * (len(values) - 1)))] if values else 0.0
+
+
+def run(game, ticks, orders=0.1):
+    """
+    Run a number of ticks, giving random heroes random orders now and then
+    ('orders' per tick). Returns the results as a dict.
+    """
+    phases = dict(commands=0.0, entities=0.0, journal=0.0, broadcast=0.0)
+    game._run_commands = timed(phases, "commands", game._run_commands)
+    game.level.update_entities = timed(phases, "entities", game.level.update_entities)
+    game.level.journal.flush = timed(phases, "journal", game.level.journal.flush)
+    game.broadcast = timed(phases, "broadcast", game.broadcast)
+    clock = game.level.clock
+    rooms = sorted(game.level.rooms)
+    durations, ops = [], 0
+    frames = FrameCounter()
+    game.queues.add(frames)
+    for _ in range(ticks):
+        clock.advance(game.period)
+        heroes = [e._id for e in game.level.entities.values() if isinstance(e, Hero)]
+        if heroes and random.random() < orders:
+            game.move_entity(random.choice(heroes), random.choice(rooms))
+        t0 = time.time()
+        event = game._loop()
+        if event:
+            game.broadcast(event, game._masks)
+        durations.append(time.time() - t0)
+        if event:
+            ops += len(event["patch"])
+    total = sum(durations)
+    durations.sort()
+    return {
+        "ticks": ticks,
+        "entities": len(game.level.entities),
+        "ticks_per_sec": ticks / total if total else None,
+        "tick_ms": {"mean": 1000 * total / ticks,
+                    "p50": 1000 * percentile(durations, 0.5),
+                    "p99": 1000 * percentile(durations, 0.99),
+                    "max": 1000 * durations[-1]},
+        "phase_ms": dict((phase, 1000 * t / ticks) for phase, t in phases.items()),
+        "ops_per_tick": float(ops) / ticks,
+        "bytes_per_tick": float(frames.bytes) / ticks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game simulation.")
+    parser.add_argument("--map", default=os.path.join(os.path.dirname(__file__), "..",
+                                                      "src", "data", "map2.json"))
+    parser.add_argument("--grid", help="generate a map instead, e.g. 20x20")
+    parser.add_argument("--heroes", type=int, default=1)
+    parser.add_argument("--monsters", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--orders", type=float, default=0.1,
+                        help="move orders given to heroes, per tick")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", action="store_true",
+                        help="keep the entity stats in arrays (needs NumPy)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.grid:
+        width, height = map(int, args.grid.split("x"))
+        data = grid_map(width, height)
+    else:
+        with open(args.map) as f:
+            data = json.load(f)
+    game = load_game(data, args.heroes, args.monsters, args.seed, args.store)
+    results = run(game, args.ticks, args.orders)
+    results.update(map=args.grid or os.path.basename(args.map), heroes=args.heroes,
+                   monsters=args.monsters, seed=args.seed, store=args.store)
+    print json.dumps(results, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+A script to compare the JSON and compact (see src/wire.py) event formats,
+by running a game without clients and encoding every patch both ways.
+
+Prints the bytes per tick and the time spent encoding per tick, as JSON.
+The game's virtual clock is moved on by a second per tick, as if the game
+was running for real.
+
+Usage:
+   python bench_wire.py [map.json] [ticks]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from listener import encode_event  # noqa
+from wire import CompactEncoder  # noqa
+
+from bench_sim import load_game  # noqa
+
+
+def main(path, ticks):
+    with open(path) as f:
+        data = json.load(f)
+    game = load_game(data, heroes=1, monsters=4)
+    rooms = sorted(game.level.rooms)
+    doors = [c for c in game.level.connections.values() if c.door]
+    encoder = CompactEncoder(game.level)
+    clock = game.level.clock
+    sizes = dict(json=0, compact=0)
+    times = dict(json=0.0, compact=0.0)
+    for event_id in range(1, ticks + 1):
+        clock.advance(1.0)
+        if event_id % 10 == 0:  # someone's at the controls
+            game.level.toggle_door(random.choice(doors)._id)
+            if "hero0" in game.level.entities:  # not dead yet
+                game.move_entity("hero0", random.choice(rooms))
+        event = game._loop()
+        if not event:
+            continue
+        t0 = time.time()
+        frame = encode_event(event, event_id)
+        t1 = time.time()
+        compact = encoder.patch(event["patch"], event_id)
+        t2 = time.time()
+        sizes["json"] += len(frame)
+        sizes["compact"] += len(compact)
+        times["json"] += t1 - t0
+        times["compact"] += t2 - t1
+    return {
+        "ticks": ticks,
+        "bytes_per_tick": dict((k, float(v) / ticks) for k, v in sizes.items()),
+        "encode_us_per_tick": dict((k, 1e6 * v / ticks) for k, v in times.items()),
+        "ratio": float(sizes["compact"]) / (sizes["json"] or 1)
+    }
+
+
+if __name__ == "__main__":
+    results = main(sys.argv[1] if len(sys.argv) > 1 else "src/data/map2.json",
+                   int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    print json.dumps(results, indent=2, sort_keys=True)
@@ -104,7 +104,7 @@ if __name__ == "__main__":
     print >>sys.stderr, "Overlapping rooms:", len(overlaps)
 
     data = {}
-    data["rooms"] = {r.id: {} for r in rooms}
+    data["rooms"] = {r.id: {"rect": make_rect(get_bbox(r))} for r in rooms}
     data["connections"] = {c: {"door": True, "locked": False,
                                "open": False, "rooms": r, "rect": b}
                            for c, (r, b) in connections.items()}
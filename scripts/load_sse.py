@@ -0,0 +1,231 @@
+"""
+A script to find out how many SSE clients (spectators) a server can keep
+up with, by connecting more and more simulated ones to a game.
+
+Clients are added in steps (e.g. 100, then up to 200, ...), and each step
+runs for a while before measuring:
+
+ - latency: from the tick to the client getting the event. When the
+   server runs in this process, the tick times are known exactly.
+   Otherwise the first client to get an event stands in for the tick.
+ - events received per second, over all clients
+ - dropped: clients whose stream ended, or never started
+ - rss_mb: the server's memory use (in-process, or given --pid)
+
+Commands (moving the hero, toggling doors) can be sent at a given rate,
+as players would.
+
+Prints a JSON line per step, and a chart of the p99 latency by number
+of clients to stderr at the end.
+
+Usage:
+   python load_sse.py [--url http://localhost:8001] [--game 1]
+                      [--steps 100,200,500,1000] [--duration 10]
+                      [--commands 2.0] [--pid PID]
+
+Without --url, the server is started in this process (from src/server.py).
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import time
+import urllib2
+import urlparse
+
+import gevent
+import gevent.monkey
+gevent.monkey.patch_all()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+def percentile(values, p):
+    "The value below which a fraction 'p' of the (sorted) values are."
+    return values[int(round(p * (len(values) - 1)))] if values else 0.0
+
+
+def rss_mb(pid):
+    "The resident memory of a process, in MB (Linux only)."
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        return None
+
+
+class Stats(object):
+
+    "What all the clients have seen, since the last step."
+
+    def __init__(self):
+        self.tick_times = {}   # event id -> when the tick happened (or was first seen)
+        self.exact = False     # whether tick times are from the server itself
+        self.latencies = []
+        self.received = 0
+        self.dropped = 0
+        self.level = None      # the first snapshot, for making up commands
+
+    def receive(self, event_id, now):
+        if not self.exact:
+            self.tick_times.setdefault(event_id, now)
+        tick_time = self.tick_times.get(event_id)
+        if tick_time is not None:
+            self.latencies.append(now - tick_time)
+        self.received += 1
+
+    def take(self):
+        "Return the latencies and the count of events received, and start over."
+        latencies, received = sorted(self.latencies), self.received
+        self.latencies, self.received = [], 0
+        return latencies, received
+
+
+def client(host, port, game_id, stats):
+    "One simulated EventSource, reading events until the stream ends."
+    try:
+        sock = socket.create_connection((host, port))
+        sock.sendall("GET /listen_game/%s HTTP/1.0\r\nAccept: text/event-stream\r\n\r\n"
+                     % game_id)
+        buf = ""
+        headers = True
+        first = True  # the state to start from, not a tick
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            now = time.time()
+            buf += data
+            if headers:
+                if "\r\n\r\n" not in buf:
+                    continue
+                buf = buf.split("\r\n\r\n", 1)[1]
+                headers = False
+            while "\n\n" in buf:
+                frame, buf = buf.split("\n\n", 1)
+                if frame.startswith("id: "):
+                    event_id, data = frame.split("\n", 1)
+                    if first:
+                        first = False
+                        if stats.level is None and data.startswith('data: {"data": '):
+                            stats.level = json.loads(data[6:])["data"]
+                    else:
+                        stats.receive(int(event_id[4:]), now)
+    except socket.error:
+        pass
+    stats.dropped += 1
+
+
+def commander(base_url, game_id, rate, stats):
+    "Send random commands to the game, 'rate' per second."
+    while True:
+        gevent.sleep(random.expovariate(rate))
+        level = stats.level
+        if not level:
+            continue
+        if random.random() < 0.5:
+            doors = [_id for _id, conn in level["connections"].items() if conn.get("door")]
+            path = "/%s/door/%s/toggle" % (game_id, random.choice(doors))
+        else:
+            path = "/%s/entity/hero/move/%s" % (game_id, random.choice(list(level["rooms"])))
+        try:
+            urllib2.urlopen(base_url + path).read()
+        except IOError:
+            pass  # e.g. the hero is dead
+
+
+def start_server(stats):
+    """
+    Run the app in this process, on a free port. The tick times are taken
+    from the games themselves. Returns the address.
+    """
+    os.chdir(ROOT)  # the app loads its data from here
+    from gevent.pywsgi import WSGIServer
+    from geventwebsocket.handler import WebSocketHandler
+    import game
+    import server
+
+    broadcast = game.Game.broadcast
+
+    def timed_broadcast(self, event, masks=None):
+        stats.tick_times[self._event_id + 1] = time.time()
+        return broadcast(self, event, masks)
+
+    game.Game.broadcast = timed_broadcast
+    stats.exact = True
+    http_server = WSGIServer(("127.0.0.1", 0), server.app, handler_class=WebSocketHandler,
+                             log=None)
+    http_server.start()
+    return "http://127.0.0.1:%d" % http_server.server_port
+
+
+def chart(results, width=50):
+    "Draw the p99 latency by number of clients, as text."
+    top = max(r["latency_ms"]["p99"] for r in results) or 1
+    lines = ["p99 latency (ms) by number of clients"]
+    for r in results:
+        p99 = r["latency_ms"]["p99"]
+        lines.append("%6d | %-*s %.1f" % (r["clients"], width, "#" * int(width * p99 / top), p99))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SSE event streams.")
+    parser.add_argument("--url", help="of a running server (default: start one here)")
+    parser.add_argument("--game", default="1")
+    parser.add_argument("--steps", default="100,200,500,1000",
+                        help="numbers of clients to measure at")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--commands", type=float, default=0.0,
+                        help="commands to send per second")
+    parser.add_argument("--pid", type=int, help="of the server, for its memory use")
+    args = parser.parse_args()
+
+    stats = Stats()
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        base_url, pid = start_server(stats), os.getpid()
+    urllib2.urlopen("%s/%s" % (base_url, args.game)).read()  # creates the game
+    address = urlparse.urlparse(base_url)
+    host, port = address.hostname, address.port or 80
+    if args.commands:
+        gevent.spawn(commander, base_url, args.game, args.commands, stats)
+
+    clients = []
+    start_rss = rss_mb(pid) if pid else None
+    results = []
+    for step in [int(n) for n in args.steps.split(",")]:
+        while len(clients) < step:
+            clients.append(gevent.spawn(client, host, port, args.game, stats))
+            if len(clients) % 50 == 0:
+                gevent.sleep(0)  # don't connect them all at once
+        stats.take()
+        gevent.sleep(args.duration)
+        latencies, received = stats.take()
+        rss = rss_mb(pid) if pid else None
+        result = {
+            "clients": step,
+            "events_per_sec": received / args.duration,
+            "latency_ms": {"p50": 1000 * percentile(latencies, 0.5),
+                           "p99": 1000 * percentile(latencies, 0.99),
+                           "max": 1000 * (latencies[-1] if latencies else 0.0)},
+            "dropped": stats.dropped,
+            "rss_mb": rss,
+            "rss_growth_mb": rss - start_rss if rss is not None else None
+        }
+        results.append(result)
+        print json.dumps(result, sort_keys=True)
+        sys.stdout.flush()
+    gevent.killall(clients)
+    print >> sys.stderr, chart(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+A two-way channel between a client and a game over a WebSocket, so that
+player commands don't need an HTTP request each.
+
+The client sends batches of commands as JSON lists, each with an id of
+its choosing, and gets the results back in one message, under the same
+ids. Commands are carried out in the order given.
+
+> [{"id": 1, "command": "move_entity", "args": ["hero", "room3"]},
+>  {"id": 2, "command": "toggle_door", "args": ["door7"]}]
+--> {"results": [{"id": 1, "result": [["room2", "door7", 1.0], ...]},
+                 {"id": 2, "result": true}]}
+
+A command that fails gets an "error" instead of a "result". If the client
+asks for it, the game's events are also pushed over the socket, as the
+data of the frames that SSE clients would get, instead of through SSE.
+"""
+
+import json
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.lock import Semaphore
+
+
+# The commands that clients may send, and the game methods carrying them out
+COMMANDS = {
+    "toggle_door": "toggle_door",
+    "move_entity": "move_entity",
+}
+
+
+def run_command(game, command, callback):
+    """
+    Give one command to the game. The response to it is passed to the
+    'callback', once the game has carried it out.
+    """
+    if not isinstance(command, dict):
+        return callback({"id": None, "error": "Not a command: %s" % json.dumps(command)})
+    response = {"id": command.get("id")}
+    name = command.get("command")
+    args = command.get("args", [])
+
+    def done(result):
+        response["result"] = result
+        callback(response)
+
+    if not isinstance(name, basestring) or name not in COMMANDS:
+        response["error"] = "Unknown command %s" % json.dumps(name)
+        return callback(response)
+    if not isinstance(args, list):
+        response["error"] = "Bad arguments for %s" % name
+        return callback(response)
+    try:
+        getattr(game, COMMANDS[name])(*args, callback=done)
+    except KeyError as e:  # no such door, entity...
+        response["error"] = "Not found: %s" % e.args[0]
+        callback(response)
+    except TypeError:
+        response["error"] = "Bad arguments for %s" % name
+        callback(response)
+
+
+def run_commands(game, batch):
+    """
+    Carry out a batch of commands, in order. They are all given to the
+    game before waiting for any, so that they can be done in the same tick.
+    """
+    results = [AsyncResult() for _ in batch]
+    for command, result in zip(batch, results):
+        run_command(game, command, result.set)
+    return {"results": [result.get() for result in results]}
+
+
+class Channel(object):
+
+    "One client's WebSocket to a game."
+
+    def __init__(self, game, socket):
+        self.game = game
+        self.socket = socket
+        self._sending = Semaphore()  # results and events are sent from different greenlets
+        self._events = None
+
+    def send(self, message):
+        with self._sending:
+            self.socket.send(message)
+
+    def push_events(self, **kwargs):
+        "Start sending the game's events too. Arguments are passed to listen()."
+        def push():
+            for frame in self.game.listen(**kwargs):
+                self.send(frame.split("data: ", 1)[1].rstrip("\n"))
+        self._events = gevent.spawn(push)
+
+    def serve(self):
+        "Handle commands until the client goes away."
+        try:
+            while True:
+                message = self.socket.receive()
+                if message is None:  # closed
+                    break
+                try:
+                    batch = json.loads(message)
+                except ValueError:
+                    self.send(json.dumps({"error": "Not JSON"}))
+                    continue
+                if isinstance(batch, dict):  # a single command is fine too
+                    batch = [batch]
+                elif not isinstance(batch, list):
+                    self.send(json.dumps({"error": "Not a list of commands"}))
+                    continue
+                self.send(json.dumps(run_commands(self.game, batch)))
+        finally:
+            if self._events is not None:
+                self._events.kill()
@@ -0,0 +1,27 @@
+"""
+Where the time in a game comes from.
+
+A game normally runs in real time, and its level then uses the time
+module as its clock. A VirtualClock instead stands still until it's
+moved on, so that a game can be run as fast as it goes, e.g. for trying
+out lots of matches. Given a seed as well, each run goes the same way:
+
+> game = Game("sim", data, clock=VirtualClock(), seed=1)
+> game.simulate(1000)  # ticks, each moving the clock on by one period
+
+Anything with a time() method will do as a clock.
+"""
+
+
+class VirtualClock(object):
+
+    "Simulated time, in seconds, that only passes when told to."
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
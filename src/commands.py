@@ -0,0 +1,68 @@
+"""
+Player commands waiting for the next tick of a game.
+
+Commands come in from request handlers at any time, but are only carried
+out at the start of a tick, all together and in the order they came in.
+That way they can't get mixed up with the updating of the level, and
+commands that come to nothing together can be dropped:
+
+ - 'cancelling' commands undo each other when given twice with the same
+   arguments, like toggling a door.
+ - 'superseding' commands replace an earlier one for the same thing (the
+   first argument), like sending an entity somewhere.
+
+> queue = CommandQueue(cancelling=["toggle_door"], superseding=["move_entity"])
+> queue.put("toggle_door", ("door1",), callback)
+> queue.put("toggle_door", ("door1",), callback)
+> queue.drain()
+--> [], [("toggle_door", ("door1",), [callback, callback])]
+"""
+
+
+class CommandQueue(object):
+
+    "The commands for one game, with a callback for the result of each."
+
+    def __init__(self, cancelling=(), superseding=()):
+        self.cancelling = set(cancelling)
+        self.superseding = set(superseding)
+        self._commands = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def put(self, name, args, callback=None):
+        "Queue a command. The callback gets the result when it's carried out."
+        self._commands.append((name, tuple(args), callback))
+
+    def drain(self):
+        """
+        Take all the queued commands. Returns the ones to carry out, in
+        order, and the ones that came to nothing, both as a list of
+        (name, args, callbacks).
+        """
+        kept = []     # [name, args, callbacks], or None if dropped
+        latest = {}   # key -> position in kept
+        dropped = []
+        for name, args, callback in self._commands:
+            callbacks = [callback] if callback is not None else []
+            if name in self.cancelling:
+                key = (name, args)
+                if key in latest:  # the two make no difference
+                    position = latest.pop(key)
+                    dropped.append((name, args, kept[position][2] + callbacks))
+                    kept[position] = None
+                    continue
+            elif name in self.superseding and args:
+                key = (name, args[0])
+                if key in latest:
+                    earlier = kept[latest[key]]
+                    kept[latest[key]] = None
+                    dropped.append(tuple(earlier))
+            else:
+                key = None
+            if key is not None:
+                latest[key] = len(kept)
+            kept.append([name, args, callbacks])
+        self._commands = []
+        return [tuple(command) for command in kept if command], dropped
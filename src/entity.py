@@ -1,10 +1,9 @@
 from abc import ABCMeta, abstractmethod
 from collections import deque
-import random
-import time
 import uuid
 
-from statemachine import StateMachine
+from statemachine import StateMachine, StateGraph
+from store import Column
 
 
 class Entity(StateMachine):
@@ -12,13 +11,36 @@ class Entity(StateMachine):
     """
     Abstract representation of an entity.
     Cannot be instantiated, for inheritance only!
+
+    Subclasses define their behavior as a StateGraph, shared by all their
+    instances, so that there can be lots of entities.
+
+    The time, and random choices, come from the level's clock and RNG.
     """
 
     __metaclass__ = ABCMeta
 
+    __slots__ = ("_id", "level", "_room", "_speed", "_chance_to_hit", "_weapon_damage",
+                 "_fight_cooldown", "_fight_timeout", "healing", "_health", "ammo", "morale",
+                 "_path", "_vision", "_timeout", "_journal", "_store", "_slot", "_wake_at")
+
+    _journaled = frozenset()  # the fields that clients know about
+    keep_history = False
+
+    # the stats that can be kept in the level's store (see store.py)
+    health = Column("health", record=True)
+    speed = Column("speed")
+    chance_to_hit = Column("chance_to_hit")
+    weapon_damage = Column("weapon_damage")
+    fight_cooldown = Column("fight_cooldown")
+    fight_timeout = Column("fight_timeout")  # when the entity can attack again
+
     def __init__(self, _id=None, level=None, room=None,
                  speed=50, chance_to_hit=0.5, weapon_damage=5, healing=0, max_health=100,
                  health=100, ammo=0, morale=100):
+        self._journal = None  # set by the level, for recording changes
+        self._store = self._slot = None  # set by the level, if it keeps a store
+        self._wake_at = None  # when the level expects to update it next
         self._id = _id if _id else str(uuid.uuid4())
         self.level = level
         self.room = room
@@ -38,16 +60,46 @@ class Entity(StateMachine):
 
         self._timeout = 0
 
-        self._fight_timeout = 0
+        self.fight_timeout = 0
+
+        StateMachine.__init__(self)
+
+    @property
+    def clock(self):
+        return self.level.clock
 
-        def log_state_change(a, b):
-            self.log("%s -> %s" % (a, b))
-        StateMachine.__init__(self, ["IDLE", "MOVING", "FIGHTING", "DEAD"],
-                              on_state_change=log_state_change)
+    @property
+    def random(self):
+        return self.level.random
 
-    def log(self, msg):
-        "Print a nice log message"
-        print " > %s:%s %s" % (self.__class__.__name__, self._id, msg)
+    def state_changed(self, old, new):
+        self.log("state", "%s -> %s", old, new)
+        self._record("state", new)
+        if self._store is not None:
+            self._store.set_fighting(self, new == "FIGHTING")
+
+    @property
+    def room(self):
+        return self._room
+
+    @room.setter
+    def room(self, room):
+        self._room = room
+        self._record("room", room and room._id)
+
+    def _record(self, field, value):
+        "Note a change in the level's journal, if it's something clients see."
+        if self._journal is not None and field in self._journaled:
+            self._journal.replace("/entities/%s/%s" % (self._id, field), value)
+
+    def _path_changed(self):
+        self._record("path", [(room._id, conn._id, dist)
+                              for room, conn, dist in self._path])
+
+    def log(self, event, message="", *args):
+        "Note something that happened to the entity in the game's log (see eventlog.py)"
+        if self.level is not None:
+            self.level.log.debug(event, message, *args, entity=self._id)
 
     def update(self):
         """
@@ -58,57 +110,93 @@ class Entity(StateMachine):
         self.proceed()
         self._behave()
 
+    def wake_time(self):
+        """
+        When the entity next needs updating, if nothing happens to it
+        meanwhile. None if not until something does.
+        """
+        state = self.state
+        if state == "MOVING":
+            return self._timeout
+        if state == "FIGHTING" and self._store is None:
+            return self.fight_timeout
+        return None
+
     def _behave(self):
         """Act according to state."""
         if self.state == "FIGHTING":
             self.fight()
         # More behavior here!
 
+    # Conditions and actions, for the state graphs
+
+    def has_path(self):
+        return bool(self._path)
+
+    def has_no_path(self):
+        return not self._path
+
+    def is_dead(self):
+        return self.health <= 0
+
+    def leave_room(self):
+        "Start going through the next connection in the path."
+        room, conn, distance = self._path[0]
+        self.set_timeout(100.0 * distance / self.speed)
+
     def enter_room(self):
         "Enter the next room in the path"
-        print self._path
         old_room, (self.room, conn, distance) = self.room, self._path.popleft()
-        self.log("went from %s to %s via %s" % (old_room, self.room, conn))
+        self._path_changed()
+        self.level.move_entity(self, old_room)
+        self.log("move", "went from %s to %s via %s", old_room._id, self.room._id, conn._id)
         self.update_vision()
 
     def set_timeout(self, dt):
         "Set a timeout that the entity will wait for."
-        self._timeout = time.time() + dt
+        self._timeout = self.clock.time() + dt
 
     def timeout_passed(self):
         "Check if the timeout has passed."
-        return time.time() >= self._timeout
+        return self.clock.time() >= self._timeout
 
     def set_destination(self, level, destination):
         "Chart a path to another room."
-        start = self._path[0] if self._path else self.room
+        # if we're on the way somewhere, we'll go on from the next room
+        start = self._path[0][0] if self._path else self.room
         path = level.get_shortest_path(start, destination)
         if path:
             if self._path:
-                first_dest = self.path.popleft()
+                next_step = self._path.popleft()
                 self._path.clear()
+                self._path.append(next_step)
             self._path.extend(path)
+            self._path_changed()
+            level.wake(self)
         return path
 
     def update_vision(self):
         "Update the entity's field of vision (rooms that can be seen)"
         connected = dict(self.level.get_connected_rooms(self.room)).keys()
-        self.vision = connected + [self.room]
+        self._vision = set(connected + [self.room])
 
     def fight(self):
         "Fight any enemies present"
         # A very simple fighting system, just attacking as often as we can
         enemies = self.get_enemies()
-        if enemies and time.time() >= self._fight_timeout:  # cooldown over
-            enemy = random.choice(enemies)  # pick a random enemy
+        if self._store is not None:
+            return enemies  # the level takes care of the fighting, all at once
+        now = self.clock.time()
+        if enemies and now >= self.fight_timeout:  # cooldown over
+            enemy = self.random.choice(enemies)  # pick a random enemy
             self.attack(enemy)
-            self._fight_timeout = time.time() + self.fight_cooldown
+            self.fight_timeout = now + self.fight_cooldown
         return enemies
 
     def attack(self, enemy):
         "Try to attack an enemy"
         # Simplest possible mechanic right now...
-        hit = random.random() < self.chance_to_hit
+        hit = self.random.random() < self.chance_to_hit
         if hit:
             enemy.damage(self.weapon_damage)
         return hit
@@ -117,7 +205,9 @@ class Entity(StateMachine):
         "Take damage"
         # We could do lots more here, e.g. reduce damage if we have armor
         self.health = max(0, self.health - amount)
-        self.log("lost %d HP -> %d!" % (amount, self.health))
+        if self.level is not None:
+            self.level.wake(self)  # it might be dead
+        self.log("damage", "lost %d HP -> %d!", amount, self.health)
 
     @abstractmethod
     def to_dict(self):
@@ -135,41 +225,41 @@ class Hero(Entity):
 
     "The protagonist"
 
-    def __init__(self, *args, **kwargs):
+    __slots__ = ()
 
-        Entity.__init__(self, *args, **kwargs)
-
-        # === Defining the state machine ===
-        # The *state* defines the current 'behavior' of an entity.
-        # The *state machine* dictates how the entity *changes* state.
-
-        # IDLE - not doing anything particular
-        self.IDLE.when(lambda: self._path)\
-                 .goto(self.MOVING)
-        self.IDLE.when(self.get_enemies)\
-                 .goto(self.FIGHTING)
-
-        # MOVING - going from room to room
-        def leave_room():
-            self.set_timeout(100.0 / self.speed)
-        self.MOVING.set_action(leave_room)
-        self.MOVING.when(self.timeout_passed)\
-            .do(self.enter_room).goto(self.IDLE)
-
-        # FIGHTING - when there are enemies present
-        self.FIGHTING.when(lambda: self.health <= 0).goto(self.DEAD)
-        # Note: it should be possible to die also when not fighting...
-        self.FIGHTING.when(lambda: self._path)\
-                     .goto(self.MOVING)
-        self.FIGHTING.when(lambda: not self.get_enemies())\
-                     .goto(self.IDLE)
+    _journaled = frozenset(["health", "room", "path", "state"])
 
     def get_enemies(self):
         "Return a list of monsters in the vicinity."
         # TODO: fight monsters in adjacent rooms too?
-        monsters = [e for e in self.level.get_entities(self.room)
-                    if isinstance(e, Monster)]
-        return monsters
+        return self.level.get_monsters(self.room)
+
+    def has_no_enemies(self):
+        return not self.get_enemies()
+
+    # === Defining the state machine ===
+    # The *state* defines the current 'behavior' of an entity.
+    # The *state machine* dictates how the entity *changes* state.
+    graph = StateGraph("IDLE", "MOVING", "FIGHTING", "DEAD")
+
+    # IDLE - not doing anything particular
+    graph.IDLE.when(Entity.has_path)\
+              .goto(graph.MOVING)
+    graph.IDLE.when(get_enemies)\
+              .goto(graph.FIGHTING)
+
+    # MOVING - going from room to room
+    graph.MOVING.set_action(Entity.leave_room)
+    graph.MOVING.when(Entity.timeout_passed)\
+        .do(Entity.enter_room).goto(graph.IDLE)
+
+    # FIGHTING - when there are enemies present
+    graph.FIGHTING.when(Entity.is_dead).goto(graph.DEAD)
+    # Note: it should be possible to die also when not fighting...
+    graph.FIGHTING.when(Entity.has_path)\
+                  .goto(graph.MOVING)
+    graph.FIGHTING.when(has_no_enemies)\
+                  .goto(graph.IDLE)
 
     def to_dict(self):
         "Representation of the Entity, for sending to the client"
@@ -184,53 +274,64 @@ class Monster(Entity):
 
     "The antagonists"
 
-    def __init__(self, restlessness=0.5, *args, **kwargs):
+    __slots__ = ("restlessness",)
 
-        Entity.__init__(self, *args, **kwargs)
+    _journaled = frozenset(["room", "path", "state"])
 
+    def __init__(self, restlessness=0.5, *args, **kwargs):
         self.restlessness = restlessness  # likelihood of wandering randomly
-
-        # === Defining the state machine ===
-
-        # IDLE - not doing anything particular
-        self.IDLE.when(lambda: self._path)\
-                 .goto(self.MOVING)
-        self.IDLE.when(self.get_enemies)\
-                 .goto(self.FIGHTING)
-        # Monsters are antsy and don't stay in one room for long
-        self.IDLE.when(lambda: random.random() < self.restlessness and
-                       self._set_random_destination())\
-                 .goto(self.MOVING)
-
-        # MOVING - going from room to room
-        def leave_room():
-            self.set_timeout(100.0 / self.speed)
-        self.MOVING.set_action(leave_room)
-        #self.MOVING.when(lambda: not self._path).goto(self.IDLE)
-        self.MOVING.when(self.timeout_passed)\
-            .do(self.enter_room).goto(self.IDLE)
-        self.MOVING.when(lambda: not self._path).goto(self.IDLE)  # not needed?
-
-        # FIGHTING - when there are enemies present
-        self.FIGHTING.when(lambda: self.health <= 0).goto(self.DEAD)
-        self.FIGHTING.when(lambda: self._path)\
-                     .goto(self.MOVING)
-        self.FIGHTING.when(lambda: not self.fight())\
-                     .goto(self.IDLE)
+        Entity.__init__(self, *args, **kwargs)
 
     def _set_random_destination(self):
         "Select an adjacent room at random."
         connected = self.level.get_connected_rooms(self.room)
         if connected:
-            room, conn = random.choice(list(connected))
-            self._path.append((room, conn, 1))
+            # sorted, as sets of rooms come in a different order each run
+            room, conn = self.random.choice(sorted(connected, key=lambda (_, c): c._id))
+            self._path.append((room, conn, self.level.get_step_distance(self.room, conn)))
+            self._path_changed()
         return connected
 
     def get_enemies(self):
         "Check if any heroes are around."
-        heroes = [e for e in self.level.get_entities(self.room)
-                  if isinstance(e, Hero)]
-        return heroes
+        return self.level.get_heroes(self.room)
+
+    def wanders_off(self):
+        return self.random.random() < self.restlessness and self._set_random_destination()
+
+    def stops_fighting(self):
+        return not self.fight()
+
+    def wake_time(self):
+        "Idle monsters may wander off at any moment, so they're always due."
+        if self.state == "IDLE" and self.restlessness:
+            return 0
+        return Entity.wake_time(self)
+
+    # === Defining the state machine ===
+    graph = StateGraph("IDLE", "MOVING", "FIGHTING", "DEAD")
+
+    # IDLE - not doing anything particular
+    graph.IDLE.when(Entity.has_path)\
+              .goto(graph.MOVING)
+    graph.IDLE.when(get_enemies)\
+              .goto(graph.FIGHTING)
+    # Monsters are antsy and don't stay in one room for long
+    graph.IDLE.when(wanders_off)\
+              .goto(graph.MOVING)
+
+    # MOVING - going from room to room
+    graph.MOVING.set_action(Entity.leave_room)
+    graph.MOVING.when(Entity.timeout_passed)\
+        .do(Entity.enter_room).goto(graph.IDLE)
+    graph.MOVING.when(Entity.has_no_path).goto(graph.IDLE)  # not needed?
+
+    # FIGHTING - when there are enemies present
+    graph.FIGHTING.when(Entity.is_dead).goto(graph.DEAD)
+    graph.FIGHTING.when(Entity.has_path)\
+                  .goto(graph.MOVING)
+    graph.FIGHTING.when(stops_fighting)\
+                  .goto(graph.IDLE)
 
     def to_dict(self):
         "Representation of the Entity, for sending to the client"
@@ -0,0 +1,172 @@
+"""
+A log of what happens in the games, kept off the tick.
+
+Records are tuples (time, level, game, tick, entity, event, message, args)
+put in an in-memory ring buffer, so logging costs an append. Messages
+are only formatted ("message % args") when the records are written out,
+in batches, by a background writer, as JSON lines to a file that is
+rotated when it gets too big. Records below the log's level are not kept
+at all, so debug logging costs next to nothing when it's off:
+
+> log.open("events.log", max_bytes=10 * 1024 * 1024, backups=3)
+> log.level = DEBUG
+> game_log = GameLog(game="1")
+> game_log.debug("state", "%s -> %s", "IDLE", "MOVING", entity="hero")
+
+If the buffer fills up before the writer gets to it, the oldest records
+are lost (and counted in 'dropped'). Without a file, the buffer just
+holds the latest records.
+"""
+
+from collections import deque
+import json
+import os
+import threading
+import time
+
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40  # as in the logging module
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+def format_record(record):
+    "A record as a line of JSON."
+    t, level, game, tick, entity, event, message, args = record
+    if args:
+        try:
+            message = message % args
+        except (TypeError, ValueError):
+            message = "%s %r" % (message, args)
+    d = dict(time=t, level=LEVEL_NAMES.get(level, level), event=event, message=message)
+    if game is not None:
+        d.update(game=str(game), tick=tick)
+    if entity is not None:
+        d["entity"] = str(entity)
+    return json.dumps(d, sort_keys=True) + "\n"
+
+
+class EventLog(object):
+
+    "The records of a process, and where they're written."
+
+    def __init__(self, capacity=10000, level=INFO, clock=time.time):
+        self.records = deque(maxlen=capacity)
+        self.level = level
+        self.clock = clock
+        self.dropped = 0  # records lost because the buffer was full
+        self.path = None
+        self.max_bytes = 0
+        self.backups = 0
+        self._file = None
+        self._lock = threading.Lock()  # around writing
+        self._writer = None
+        self._stopped = threading.Event()
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def record(self, level, event, message="", args=(), game=None, tick=None, entity=None):
+        "Keep a record, if the level is enabled. The message is formatted later."
+        if level >= self.level:
+            records = self.records
+            if len(records) == records.maxlen:
+                self.dropped += 1
+            records.append((self.clock(), level, game, tick, entity, event, message, args))
+
+    def open(self, path, max_bytes=10 * 1024 * 1024, backups=3, interval=0.5):
+        """
+        Start writing the records to a file, every 'interval' seconds (or
+        only when flushed, if None). The file is rotated when it would go
+        over 'max_bytes' (0 for never), keeping 'backups' old ones (path.1,
+        path.2...).
+        """
+        self.close()
+        self.path, self.max_bytes, self.backups = path, max_bytes, backups
+        self._file = open(path, "a")
+        if interval is not None:
+            self._stopped.clear()
+            self._writer = threading.Thread(target=self._write_every, args=(interval,))
+            self._writer.daemon = True
+            self._writer.start()
+
+    def close(self):
+        "Write what's left, and stop writing."
+        if self._writer is not None:
+            self._stopped.set()
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_every(self, interval):
+        while not self._stopped.wait(interval):
+            self.flush()
+
+    def take(self):
+        "Take all the records in the buffer, oldest first."
+        records = self.records
+        taken = []
+        while records:
+            taken.append(records.popleft())
+        return taken
+
+    def flush(self):
+        "Write out the buffered records, if there's a file to write them to."
+        with self._lock:
+            if self._file is None:
+                return
+            data = "".join(format_record(record) for record in self.take())
+            if not data:
+                return
+            if self.max_bytes and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+
+    def _rotate(self):
+        "Move the file out of the way (along with the older ones) and start a new one."
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = "%s.%d" % (self.path, i)
+            if os.path.exists(older):
+                os.rename(older, "%s.%d" % (self.path, i + 1))
+        if self.backups:
+            os.rename(self.path, self.path + ".1")
+        self._file = open(self.path, "w")
+
+
+log = EventLog()  # the process wide one
+
+
+class GameLog(object):
+
+    """
+    Logging for one game: records are tagged with the game and the
+    current tick (kept up to date by the game).
+    """
+
+    def __init__(self, game=None, sink=None):
+        self.game = game
+        self.tick = 0
+        self.sink = sink if sink is not None else log
+
+    def enabled(self, level):
+        return level >= self.sink.level
+
+    def log(self, level, event, message="", *args, **tags):
+        if level >= self.sink.level:
+            self.sink.record(level, event, message, args, self.game, self.tick,
+                             tags.get("entity"))
+
+    def debug(self, event, message="", *args, **tags):
+        if DEBUG >= self.sink.level:
+            self.sink.record(DEBUG, event, message, args, self.game, self.tick,
+                             tags.get("entity"))
+
+    def info(self, event, message="", *args, **tags):
+        self.log(INFO, event, message, *args, **tags)
+
+    def warning(self, event, message="", *args, **tags):
+        self.log(WARNING, event, message, *args, **tags)
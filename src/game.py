@@ -1,13 +1,21 @@
+from collections import deque
 import json
+import time
 import uuid
 
 import gevent
-from gevent.queue import Queue
+from gevent.event import AsyncResult
 from gevent.lock import BoundedSemaphore
-from jsonpatch import JsonPatch
 
-from level import Level, Room, Connection
+from commands import CommandQueue
+from level import Level, LevelTemplate, Room, Connection
 from entity import Entity
+from eventlog import GameLog
+from interest import View
+from listener import Listener, encode_event
+from metrics import GameMetrics
+from recording import Recorder
+from wire import CompactEncoder
 
 
 class GameDataEncoder(json.JSONEncoder):
@@ -17,77 +25,373 @@ class GameDataEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# What to do when a game has fallen behind its tick schedule
+CATCH_UP = "catch up"  # run the missed ticks (up to a limit) in a row
+SKIP = "skip"          # forget about the missed ticks, just run one
+
+
+class TickStats(object):
+
+    "Keeps track of how well a game keeps up with its schedule."
+
+    def __init__(self):
+        self.ticks = 0           # ticks run
+        self.skipped = 0         # ticks skipped to get back on schedule
+        self.lag = 0.0           # how late the last tick started, in seconds
+        self.max_lag = 0.0
+        self.duration = 0.0      # how long the last tick took, in seconds
+        self.max_duration = 0.0
+
+    def record(self, lag, duration):
+        self.ticks += 1
+        self.lag, self.max_lag = lag, max(lag, self.max_lag)
+        self.duration, self.max_duration = duration, max(duration, self.max_duration)
+
+
 class Game(object):
 
-    "The main game loop thingy. What drives the game."
+    """
+    The main game loop thingy. What drives the game.
+
+    Ticks are scheduled at fixed times, every 'period' seconds, so that
+    the time spent running them doesn't make the game drift. If the game
+    falls behind, the 'policy' decides whether to catch up or skip.
+
+    A game runs its own greenlet, unless it's given a 'scheduler' (see
+    scheduler.py) to run it along with other games.
 
-    def __init__(self, _id=None, data=None):
-        self._id = _id if _id else uuid.uuid4()
-        self.level = Level.from_dict(data) if data else None
+    Events are numbered, and the last 'history' of them are kept, along
+    with a full state "keyframe" every 'keyframe_interval' events. This
+    way a client that reconnects only needs what it missed. The numbers
+    start from the game's 'epoch', by default the time it was made in
+    milliseconds, so that the ids a client got from an earlier game (e.g.
+    before the server restarted) aren't taken for this one's.
 
+    The level is made from map 'data', or from a LevelTemplate, which is
+    much cheaper when there are many games on the same map.
+
+    The 'level_options' are passed on to the Level, e.g. store=True. So
+    are the 'clock' and 'seed', which the level's entities go by: with a
+    virtual clock (see clock.py) the game can also be run without waiting
+    for real time to pass, see simulate.
+
+    Player commands (toggle_door, move_entity) wait for the start of the
+    next tick while the game is running, see commands.py.
+
+    What happens in a game can be recorded, for replaying, see record.
+    """
+
+    def __init__(self, _id=None, data=None, period=1.0, policy=CATCH_UP, max_catch_up=5,
+                 scheduler=None, history=100, keyframe_interval=50, level_options=None,
+                 clock=None, seed=None, epoch=None):
+        self._id = _id if _id is not None else uuid.uuid4()
+        if isinstance(data, LevelTemplate):
+            self.level = data.create(clock=clock, seed=seed, **(level_options or {}))
+        elif data:
+            self.level = Level.from_dict(data, clock=clock, seed=seed, **(level_options or {}))
+        else:
+            self.level = None
+        self.log = GameLog(self._id)  # see eventlog.py
+        if self.level is not None:
+            self.level.log = self.log
+        if self.level:
+            self.level.journal.flush()  # nobody has seen the level yet
+
+        self.period = period
+        self.policy = policy
+        self.max_catch_up = max_catch_up  # most ticks to run in a row
+        self.stats = TickStats()
+        self.metrics = GameMetrics()  # see metrics.py
+        self._deadline = None  # when the next tick should run
+
+        self.scheduler = scheduler
         self._lock = BoundedSemaphore()
         self._main = None    # will hold a reference to the main greenlet
-        self._cache = None   # previous game state is kept for detecting changes
+        self._snapshot = None  # encoded full game state, until something changes
+        if epoch is None:
+            epoch = int((clock or time).time() * 1000)
+        self.epoch = epoch     # the id before the first event
+        self._event_id = epoch  # the id of the latest event
+        self._recent = deque(maxlen=max(history, keyframe_interval))  # (id, frame)
+        self._keyframe = None  # (id, frame) of the latest full state event
+        self.keyframe_interval = keyframe_interval
         self.queues = set()  # each client gets a queue where change events are put
+        self.listener_options = {}  # settings for the queues, see listener.py
+        self.views = {}  # hero id -> what clients following that hero see
+        self.compact_queues = set()  # listeners using the compact format, see wire.py
+        self._compact = None  # the encoder for them
+        self._masks = None  # the rooms concerned by each change in the last update
+        self.commands = CommandQueue(cancelling=["toggle_door"],
+                                     superseding=["move_entity"])
+        self.recorder = None  # see record
+
+    def run(self):
+        "Start running the game, in the background"
+        if self.recorder is not None and self.recorder.closed:
+            self.recorder.reopen()
+        if self.scheduler is not None:
+            self.scheduler.add(self)
+        else:
+            self._main = gevent.spawn(self.start)
 
-    def start(self, period=1.0):
-        "Start running the game"
+    def start(self, period=None):
+        "Run the game in the current greenlet"
+        self.period = period or self.period
+        self._deadline = time.time() + self.period
         while True:
-            gevent.sleep(period)
+            gevent.sleep(max(0, self._deadline - time.time()))
+            self.step()
+
+    def step(self, now=None):
+        """
+        Run the tick(s) that are due, and return when the next one is.
+        """
+        now = time.time() if now is None else now
+        behind = int((now - self._deadline) // self.period)  # whole ticks missed
+        steps = 1
+        if behind > 0:
+            if self.policy == CATCH_UP:
+                steps = min(behind + 1, self.max_catch_up)
+            skipped = behind + 1 - steps
+            self.stats.skipped += skipped
+            self._deadline += skipped * self.period
+        for _ in range(steps):
+            started = time.time()
+            self._tick()
+            duration = time.time() - started
+            self.stats.record(now - self._deadline, duration)
+            self.metrics.time("tick", duration)
+            self._deadline += self.period
+        return self._deadline
+
+    def _tick(self):
+        res = self._loop()
+        if not self.queues and not self.views and not self.compact_queues:
+            self.stop()
+        elif res:
+            self.broadcast(res, self._masks)
+
+    def simulate(self, ticks):
+        """
+        Run a number of ticks back to back, moving the level's (virtual)
+        clock on by a period before each, instead of waiting.
+        """
+        for _ in range(ticks):
+            self.level.clock.advance(self.period)
             res = self._loop()
-            if not self.queues:
-                self.stop()
-            elif res:
-                self.broadcast(res)
+            self.stats.ticks += 1
+            if res:
+                self.broadcast(res, self._masks)
+
+    def record(self, path, **options):
+        "Start recording the game to a file, from now on. See recording.py"
+        options.setdefault("period", self.period)
+        self.recorder = Recorder(path, self.level, self.stats.ticks, **options)
 
     def stop(self):
         "Stop running the game"
-        self._main.kill()
-        self._main = None
-        print "stopped game", self._id
+        self.log.info("stop")
+        self._run_commands()  # nobody should be left waiting
+        if self.scheduler is not None:
+            self.scheduler.remove(self)
+        if self.recorder is not None:
+            self.recorder.close()  # until the game runs again
+        if self._main is not None:
+            main, self._main = self._main, None
+            main.kill()  # note: does not return if we are the main greenlet
 
-    def broadcast(self, event):
-        "Send event data to all listeners"
+    def broadcast(self, event, masks=None):
+        """
+        Send event data to all listeners. The 'masks' of the rooms concerned
+        by each change in a patch are needed for filtering (see interest.py).
+        """
+        started = time.time()
+        self._event_id += 1
+        frame = encode_event(event, self._event_id)  # encoded once, shared by everyone
+        self.metrics.time("encode", time.time() - started)
+        self.metrics.events += 1
+        if "patch" in event:
+            self.metrics.ops.observe(len(event["patch"]))
+        self._recent.append((self._event_id, frame))
+        if (self._event_id - self.epoch) % self.keyframe_interval == 0:
+            self._keyframe = (self._event_id, self.snapshot())
         for queue in self.queues:
-            queue.put(event)
+            queue.put(frame)
+        if self.compact_queues and "patch" in event:
+            frame = self._compact.patch(event["patch"], self._event_id)
+            for queue in self.compact_queues:
+                queue.put(frame)
+        if self.views and "patch" in event:
+            patch = event["patch"]
+            masks = masks or [0] * len(patch)
+            for view in self.views.values():
+                view.broadcast(patch, masks, self._event_id)
+        self.metrics.time("broadcast", time.time() - started)
 
-    def listen(self):
-        "Add a listener (client)"
-        queue = Queue()
-        self.queues.add(queue)  # add a listener queue
-        queue.put({"data": self.level.to_dict()})  # client needs game data to start
+    def snapshot(self):
+        "The full game state as an event frame."
+        if self._snapshot is None:
+            started = time.time()
+            data = self.level.to_dict()
+            self.metrics.time("to_dict", time.time() - started)
+            self._snapshot = encode_event({"data": data}, self._event_id)
+        return self._snapshot
+
+    def resume(self, last_event_id=None):
+        """
+        Return the frames a listener needs to get up to date, given the id
+        of the last event it got (if any).
+        """
+        if last_event_id is not None and self.epoch <= last_event_id <= self._event_id:
+            oldest = self._recent[0][0] if self._recent else self._event_id + 1
+            if last_event_id >= oldest - 1:  # we have all it's missed
+                return [frame for _id, frame in self._recent if _id > last_event_id]
+        if self._snapshot is None and self._keyframe:
+            # cheaper to start from the keyframe than to build a snapshot
+            keyframe_id, keyframe = self._keyframe
+            return [keyframe] + [frame for _id, frame in self._recent if _id > keyframe_id]
+        return [self.snapshot()]
+
+    def _compact_snapshot(self):
+        return self._compact.snapshot(self._event_id)
+
+    def listen(self, last_event_id=None, hero=None, format="json"):
+        """
+        Add a listener (client). If it's following a 'hero' (id), it only
+        gets to know about what the hero can see. Otherwise, it can ask for
+        the "compact" format instead of JSON patches (see wire.py).
+        """
+        if hero is not None:
+            view = self.views.get(hero)
+            if view is None:
+                view = self.views[hero] = View(self.level, hero)
+                view.event_id = self._event_id
+            queues = view.listeners
+            queue = Listener(view.snapshot, **self.listener_options)
+            frames = [view.snapshot()]  # filtered events can't be resumed
+        elif format == "compact":
+            if self._compact is None:
+                self._compact = CompactEncoder(self.level)
+            queues = self.compact_queues
+            queue = Listener(self._compact_snapshot, **self.listener_options)
+            frames = [self._compact_snapshot()]
+        else:
+            queues = self.queues
+            queue = Listener(self.snapshot, **self.listener_options)
+            frames = self.resume(last_event_id)
+        queues.add(queue)  # add a listener queue
+        for frame in frames:  # client needs game data to start
+            queue.put(frame)
         with self._lock:
             if not self.is_running:
-                self._main = gevent.spawn(self.start)  # start the game
+                self.run()  # start the game
         try:
             # client listener loop
             while self.is_running:
-                data = queue.get()  # wait for updates
-                yield "data: %s\n\n" % json.dumps(data)
+                frame = queue.get()  # wait for updates
+                if frame is None:
+                    self.log.warning("listener", "dropped a listener that fell behind")
+                    self.metrics.dropped += 1
+                    break
+                yield frame
         except GeneratorExit:
-            print "A listener left game %s!" % self._id
-            self.queues.remove(queue)
+            self.log.info("listener", "a listener left")
+        finally:
+            queues.discard(queue)
+            if hero is not None and not queues:
+                del self.views[hero]
+
+    def listener_lags(self):
+        "How far behind each listener is, as (events, seconds)"
+        return [queue.lag for queue in self.queues | self.compact_queues] + [
+            queue.lag for view in self.views.values() for queue in view.listeners]
+
+    def _command(self, name, args, callback):
+        """
+        Carry out a command at the start of the next tick. The result is
+        passed to the 'callback' if given, or else waited for and returned.
+        If the game isn't running, there's no need to wait.
+        """
+        if not self.is_running:
+            result = getattr(self, "_" + name)(*args)
+            return callback(result) if callback else result
+        if callback:
+            return self.commands.put(name, args, callback)
+        result = AsyncResult()
+        self.commands.put(name, args, result.set)
+        return result.get()
+
+    def _run_commands(self):
+        """
+        Carry out the commands that came in since the last tick. Returns
+        the ones that were, as (name, args).
+        """
+        commands, dropped = self.commands.drain()
+        for name, args, callbacks in commands:
+            try:
+                result = getattr(self, "_" + name)(*args)
+            except KeyError:  # e.g. the entity is gone since
+                result = None
+            for callback in callbacks:
+                callback(result)
+        for name, args, callbacks in dropped:
+            # toggles that cancel out would have worked (or not) all the same,
+            # while superseded moves go nowhere
+            result = self.level.can_toggle_door(*args) if name == "toggle_door" else None
+            for callback in callbacks:
+                callback(result)
+        return [(name, args) for name, args, _ in commands]
+
+    def toggle_door(self, door_id, callback=None):
+        "Open or close a door, if possible."
+        self.level.connections[door_id]  # check that it exists, now
+        return self._command("toggle_door", (door_id,), callback)
+
+    def _toggle_door(self, door_id):
+        return self.level.toggle_door(door_id)
+
+    def move_entity(self, entity_id, room_id, callback=None):
+        """
+        Send an entity off to a room. Returns the path it will take, if any,
+        as a list of (room id, connection id, distance).
+        """
+        self.level.entities[entity_id], self.level.rooms[room_id]  # check, now
+        return self._command("move_entity", (entity_id, room_id), callback)
+
+    def _move_entity(self, entity_id, room_id):
+        entity = self.level.entities[entity_id]
+        room = self.level.rooms[room_id]
+        path = entity.set_destination(self.level, room)
+        return path and [(r._id, conn._id, dist) for r, conn, dist in path]
 
     @property
     def is_running(self):
-        return self._main
+        return self._main is not None or (self.scheduler is not None and
+                                          self in self.scheduler)
 
     def _loop(self):
         "Do updates and check if anything changed."
         result = self._update()
         if result:
-            return dict(patch=list(result))
+            self._snapshot = None  # out of date now
+            return dict(patch=result)
 
     def _update(self):
-        "Update the level, entities, etc"
-        # TODO: Should be possible to be smarter here and not generate
-        # the dicts on each update if nothing actually happened.
+        """
+        Update the level, entities, etc. Returns the list of changes made
+        since the last update, as JSON patch operations.
+        """
+        self.log.tick = self.stats.ticks
+        t0 = time.time()
+        commands = self._run_commands()
+        t1 = time.time()
         self.level.update_entities()
-        data = self.level.to_dict()
-        if self._cache:
-            patch = JsonPatch.from_diff(self._cache, data)
-            if patch:  # something has changed!
-                self._cache = data
-                return patch
-        else:
-            self._cache = data
+        t2 = time.time()
+        ops, self._masks = self.level.journal.flush(with_masks=True)
+        if self.recorder is not None:
+            self.recorder.tick(self.stats.ticks, commands, ops)
+        t3 = time.time()
+        self.metrics.time("commands", t1 - t0)
+        self.metrics.time("entities", t2 - t1)
+        self.metrics.time("journal", t3 - t2)
+        return ops
@@ -0,0 +1,99 @@
+"""
+Filtering what clients get to see, based on what a hero can see.
+
+A client following a hero only needs to know about the entities in the
+rooms visible to the hero (its own room, and the rooms it can reach
+directly), and about changes to those rooms and their doors. The rest of
+the map is in the first snapshot, but not kept up to date outside the
+hero's vision.
+
+Rooms and connections are matched against the vision using the room
+masks that the level and its journal keep (see Level.__init__), and
+entities using the room occupancy index. This makes filtering a patch
+cost about the same as the patch itself, per hero followed.
+"""
+
+from listener import encode_event
+
+
+class View(object):
+
+    "What one hero can see, shared by all clients following that hero."
+
+    def __init__(self, level, hero_id):
+        self.level = level
+        self.hero_id = hero_id
+        self.listeners = set()
+        self.event_id = 0
+        self._room = None    # where the hero was last seen
+        self._mask = 0       # the rooms visible, as a mask
+        self._known = set()  # ids of the entities the clients know about
+        rooms, self._mask = self._look()
+        self._known = set(e._id for e in self._visible_entities(rooms))
+
+    def _look(self):
+        "Return the rooms the hero can see, as a list and as a mask."
+        hero = self.level.entities.get(self.hero_id)
+        if hero is not None:
+            self._room = hero.room
+        if self._room is None:
+            return [], 0
+        rooms = [self._room] + [room for room, _ in self.level.get_connected_rooms(self._room)]
+        mask = 0
+        for room in rooms:
+            mask |= room.bit
+        return rooms, mask
+
+    def _visible_entities(self, rooms):
+        return [e for room in rooms for e in self.level.get_entities(room)]
+
+    def snapshot(self):
+        "The full state, as seen by the hero, as an event frame."
+        entities = [self.level.entities[_id] for _id in self._known]
+        return encode_event({"data": self.level.to_dict(entities)}, self.event_id)
+
+    def filter(self, ops, masks):
+        "Turn the changes to the level into the changes the hero can see."
+        rooms, mask = self._look()
+        visible = dict((e._id, e) for e in self._visible_entities(rooms))
+        known = self._known
+
+        # entities that went out of view, or went away entirely
+        result = [dict(op="remove", path="/entities/%s" % _id)
+                  for _id in known if _id not in visible]
+        for op, op_mask in zip(ops, masks):
+            path = op["path"]
+            if path.startswith("/entities/"):
+                # additions and removals are taken care of separately
+                parts = path.split("/", 3)
+                if len(parts) == 4 and parts[2] in known and parts[2] in visible:
+                    result.append(op)
+            elif op_mask & mask:
+                result.append(op)
+        # entities that came into view
+        result.extend(dict(op="add", path="/entities/%s" % _id, value=e.to_dict())
+                      for _id, e in visible.items() if _id not in known)
+        # the doors of rooms that came into view may have changed meanwhile
+        # (unless the patch already has the change)
+        new_rooms = [room for room in rooms if room.bit & ~self._mask]
+        seen = set(op["path"] for op in result)
+        for room in new_rooms:
+            for conn in self.level.get_connections(room):
+                for name in ("opened", "locked"):
+                    path = "/connections/%s/%s" % (conn._id, name)
+                    if path not in seen:
+                        seen.add(path)
+                        result.append(dict(op="replace", path=path, value=getattr(conn, name)))
+
+        self._known = set(visible)
+        self._mask = mask
+        return result
+
+    def broadcast(self, ops, masks, event_id):
+        "Send the changes the hero can see to the clients following it."
+        self.event_id = event_id
+        patch = self.filter(ops, masks)
+        if patch:
+            frame = encode_event({"patch": patch}, event_id)  # once per hero
+            for listener in self.listeners:
+                listener.put(frame)
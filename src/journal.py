@@ -0,0 +1,76 @@
+"""
+Keeps track of changes to the game state as they happen, so that they
+can be sent to clients without comparing the whole state between ticks.
+
+Changes are recorded as JSON patch (RFC 6902) operations, keyed on their
+path, so that several changes to the same thing during a tick only
+result in one operation. Each operation can also be given a mask of the
+rooms it concerns (see Level), for filtering what clients get to see.
+
+> journal = Journal()
+> journal.replace("/entities/hero/health", 90)
+> journal.replace("/entities/hero/health", 80)
+> journal.flush()
+--> [{"op": "replace", "path": "/entities/hero/health", "value": 80}]
+"""
+
+from collections import OrderedDict
+
+
+class Journal(object):
+
+    "Collects the changes made since the last flush, as patch operations."
+
+    def __init__(self):
+        self._ops = OrderedDict()  # path -> operation
+        self._masks = {}           # path -> rooms concerned
+        self._readded = set()      # paths added again after being removed
+
+    def __len__(self):
+        return len(self._ops)
+
+    def _put(self, op, mask):
+        path = op["path"]
+        self._ops.pop(path, None)
+        self._ops[path] = op
+        if mask:
+            self._masks[path] = self._masks.get(path, 0) | mask
+
+    def add(self, path, value, mask=0):
+        "Something new was created at the path."
+        op = self._ops.get(path)
+        if op and op["op"] == "remove":
+            self._readded.add(path)
+        self._put(dict(op="add", path=path, value=value), mask)
+
+    def replace(self, path, value, mask=0):
+        "The value at the path was changed."
+        self._put(dict(op="replace", path=path, value=value), mask)
+
+    def remove(self, path, mask=0):
+        """
+        The thing at the path is gone. Any pending changes to it are dropped,
+        and if it was also added since the last flush, nobody needs to know
+        (unless it had been there before, and was removed in between).
+        """
+        prefix = path + "/"
+        for p in [p for p in self._ops if p.startswith(prefix)]:
+            del self._ops[p]
+            self._masks.pop(p, None)
+        op = self._ops.pop(path, None)
+        if op and op["op"] == "add" and path not in self._readded:
+            self._masks.pop(path, None)
+        else:
+            self._put(dict(op="remove", path=path), mask)
+
+    def flush(self, with_masks=False):
+        """
+        Return the recorded operations, in order, and start over.
+        If 'with_masks' is set, a list of their room masks is returned too.
+        """
+        ops = self._ops.values()
+        masks = [self._masks.get(path, 0) for path in self._ops] if with_masks else None
+        self._ops.clear()
+        self._masks.clear()
+        self._readded.clear()
+        return (ops, masks) if with_masks else ops
@@ -1,18 +1,43 @@
-from collections import OrderedDict
+from collections import defaultdict, deque
 from copy import deepcopy
+from itertools import count
+from heapq import heappush, heappop
+from math import hypot
 import random
+import time
 import uuid
 
-from entity import Entity, Monster
+from entity import Entity, Hero, Monster
+from eventlog import GameLog
+from journal import Journal
+from store import EntityStore, HERO, MONSTER
 
 
 class Room(object):
 
-    "A room in a level."
+    """
+    A room in a level. Its items are replaced when they change, never
+    changed in place, as levels made from a template start out sharing them.
+    """
 
-    def __init__(self, _id=None, items=None):
+    __slots__ = ("_id", "_items", "rect", "journal", "bit")
+
+    def __init__(self, _id=None, items=None, rect=None):
+        self.journal = None  # set by the level, for recording changes
+        self.bit = 0  # set by the level, see Level.__init__
         self._id = _id if _id else uuid.uuid4()
         self.items = items if items else []
+        self.rect = rect  # bounding box on the map, if known
+
+    @property
+    def items(self):
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = items
+        if self.journal is not None:
+            self.journal.replace("/rooms/%s/items" % self._id, items, self.bit)
 
     def __repr__(self):
         "Return a string representation, for printing etc"
@@ -31,12 +56,18 @@ class Connection(object):
 
     "A connection (e.g. a door) between two rooms."
 
-    def __init__(self, _id=None, door=False, opened=True, locked=False, rooms=None):
+    __slots__ = ("_id", "door", "_opened", "_locked", "rooms", "rect", "journal", "mask")
+
+    def __init__(self, _id=None, door=False, opened=True, locked=False, rooms=None,
+                 rect=None):
+        self.journal = None  # set by the level, for recording changes
+        self.mask = 0  # the bits of the rooms it connects, set by the level
         self._id = _id if _id else uuid.uuid4()
         self.door = door
         self.opened = opened
         self.locked = locked
-        self.rooms = set(rooms) if rooms else []
+        self.rooms = frozenset(rooms or ())
+        self.rect = rect  # where on the map the passage is
 
     def __repr__(self):
         return "Door: %s" % self._id
@@ -45,87 +76,503 @@ class Connection(object):
         "The truth value of a connection can be checked to see if it's passable."
         return self.opened
 
+    @property
+    def opened(self):
+        return self._opened
+
+    @opened.setter
+    def opened(self, opened):
+        self._opened = opened
+        if self.journal is not None:
+            self.journal.replace("/connections/%s/opened" % self._id, opened, self.mask)
+
+    @property
+    def locked(self):
+        return self._locked
+
+    @locked.setter
+    def locked(self, locked):
+        self._locked = locked
+        if self.journal is not None:
+            self.journal.replace("/connections/%s/locked" % self._id, locked, self.mask)
+
     def to_dict(self):
         return dict(rooms=list(self.rooms), door=self.door, opened=self.opened, locked=self.locked)
 
 
+def rect_center(rect):
+    "The center point of a rect dict, as written by scripts/graph_map.py"
+    return (rect["x"] + rect["width"] / 2.0, rect["y"] + rect["height"] / 2.0)
+
+
+class LevelTemplate(object):
+
+    """
+    What never changes about a level, worked out once and shared by all
+    the levels made from it: which connections each room has, the room
+    bits and connection masks (see Level), and for weighted levels, the
+    geometry and the cost of each step.
+
+    A template made from map data (from_dict) also holds the rooms,
+    connections and entities to start with. Making a level from it then
+    only takes copies of what can change: the doors, the items in the
+    rooms (shared until replaced) and the entities. That's how games on
+    the same map are made:
+
+    > template = LevelTemplate.from_dict(data)
+    > level = template.create(store=True)
+    """
+
+    def __init__(self, rooms, connections, weighted=False):
+        self._id = None
+        self.rooms, self.connections, self.entities = [], [], []  # to start with
+        self.room_ids = [room._id for room in rooms]
+        self.bits = dict((_id, 1 << i) for i, _id in enumerate(self.room_ids))
+        self.masks = {}
+        # room id -> [(connection id, the room on the other side)]
+        self.neighbours = dict((_id, []) for _id in self.room_ids)
+        for conn in connections:
+            self.masks[conn._id] = 0
+            room1, room2 = conn.rooms
+            for room, other in ((room1, room2), (room2, room1)):
+                self.masks[conn._id] |= self.bits[room]
+                self.neighbours[room].append((conn._id, other))
+        self.weighted = weighted
+        if weighted:
+            self._index_geometry(rooms, connections)
+
+    def _index_geometry(self, rooms, connections):
+        """
+        Precompute what the weighted pathfinding needs: integer indices
+        for the rooms, room centers and door positions, and the cost of
+        going through each connection. Rooms without a rect of their own
+        are placed at the mean of their connections.
+        """
+        if not all(conn.rect for conn in connections):
+            raise ValueError("Weighted pathfinding needs a rect for every connection")
+        rects = dict((room._id, room.rect) for room in rooms)
+        self.room_index = dict((_id, i) for i, _id in enumerate(self.room_ids))
+        n = len(self.room_ids)
+        self.doors = dict((conn._id, rect_center(conn.rect)) for conn in connections)
+        sums = [[0.0, 0.0, 0] for _ in range(n)]
+        for conn in connections:
+            x, y = self.doors[conn._id]
+            for room in conn.rooms:
+                acc = sums[self.room_index[room]]
+                acc[0] += x
+                acc[1] += y
+                acc[2] += 1
+        self.xs, self.ys = [0.0] * n, [0.0] * n
+        for i, _id in enumerate(self.room_ids):
+            rect = rects[_id]
+            if rect:
+                self.xs[i], self.ys[i] = rect_center(rect)
+            elif sums[i][2]:
+                self.xs[i], self.ys[i] = sums[i][0] / sums[i][2], sums[i][1] / sums[i][2]
+
+        self.scale = 1.0
+        costs = dict((conn._id, self._step_cost(list(conn.rooms)[0], conn))
+                     for conn in connections)
+        if costs:
+            self.scale = (sum(costs.values()) / len(costs)) or 1.0
+        self.costs = dict((_id, cost / self.scale) for _id, cost in costs.items())
+
+        # scratch space reused by every search, on any level made from the
+        # template (searches don't yield to other greenlets), entries are
+        # only valid where the stamp equals the current search number
+        self._search = 0
+        self._stamp, self._closed = [0] * n, [0] * n
+        self._g, self._came_from, self._via = [0.0] * n, [0] * n, [None] * n
+
+    def _step_cost(self, room_id, conn):
+        "Distance from a room's center, through a connection, to the other room's."
+        i = self.room_index[room_id]
+        other, = conn.rooms - set([room_id])
+        j = self.room_index[other]
+        x, y = self.doors[conn._id]
+        return (hypot(x - self.xs[i], y - self.ys[i]) +
+                hypot(self.xs[j] - x, self.ys[j] - y))
+
+    @classmethod
+    def from_dict(cls, data, weighted=None):
+        """
+        Make a template from map data, with what's in it to start with.
+        Paths are weighted by default if the data has the geometry for it.
+        """
+        rooms = [Room(_id, room.get("items", []), rect=room.get("rect"))
+                 for _id, room in data["rooms"].items()]
+        connections = [Connection(_id, door=conn.get("door"), rooms=conn.get("rooms", []),
+                                  rect=conn.get("rect"))
+                       for _id, conn in data["connections"].items()]
+        if weighted is None:
+            weighted = all(conn.rect for conn in connections)
+        template = cls(rooms, connections, weighted)
+        template._id = data["_id"]
+        template.rooms, template.connections = rooms, connections
+        template.entities = deepcopy(data["entities"])
+        return template
+
+    def create(self, **kwargs):
+        "Make a new level, in the starting state. Takes the options of Level."
+        rooms = [Room(room._id, room.items, room.rect) for room in self.rooms]
+        connections = [Connection(conn._id, conn.door, conn.opened, conn.locked, conn.rooms,
+                                  conn.rect)
+                       for conn in self.connections]
+        level = Level(self._id, rooms, connections, template=self, **kwargs)
+        level.add_entities(dict(entity) for entity in self.entities)
+        return level
+
+
 class Level(object):
 
-    "A floor level."
+    """
+    A floor level.
+
+    Paths are normally found by counting steps between rooms. A 'weighted'
+    level instead measures them on the actual map geometry, which requires
+    that every connection has a rect. Distances are then scaled so that
+    the average step between two rooms is 1. With 'routing' set, the
+    routes to each destination are worked out once and cached; otherwise
+    each path is searched for (with A*, if weighted).
+
+    The level keeps the time with its 'clock' (anything with a time()
+    method, see clock.py) and makes its random choices, and those of its
+    entities, with its own RNG. Given the same 'seed', a level run on a
+    virtual clock goes the same way every time.
+
+    If 'store' is set, the stats of the entities are kept in arrays and
+    all fights are resolved together, once per update (see store.py).
 
-    def __init__(self, _id=None, rooms=None, connections=None):
+    Entities are only updated when there's a reason to: when a timeout of
+    theirs is up (see Entity.wake_time), or when they've been woken by
+    something happening to them or in their room (see wake).
+
+    What doesn't change about the map is kept in a LevelTemplate, which
+    can be shared with other levels (given as 'template', it must have
+    been made for the same rooms and connections).
+    """
+
+    def __init__(self, _id=None, rooms=None, connections=None, routing=True,
+                 weighted=False, store=False, clock=None, seed=None, template=None):
         self._id = _id or uuid.uuid4()
         self.rooms = {room._id: room for room in (rooms if rooms else [])}
         self.connections = {conn._id: conn for conn in (connections if connections else [])}
         self.entities = {}
+        self.log = GameLog(self._id)  # the game sets its own
+
+        # changes are recorded here as they happen, see journal.py
+        self.journal = Journal()
+        for thing in self.rooms.values() + self.connections.values():
+            thing.journal = self.journal
+
+        if template is None:
+            template = LevelTemplate(self.rooms.values(), self.connections.values(), weighted)
+        self.template = template
+
+        # Each room gets a bit, so that a set of rooms can be represented
+        # as a number (a "mask"). Used e.g. for deciding what to show clients.
+        for room in self.rooms.values():
+            room.bit = template.bits[room._id]
+        for conn in self.connections.values():
+            conn.mask = template.masks[conn._id]
+
+        # room id -> {entity id: entity} for the heroes/monsters in it (keyed
+        # by id rather than a set, so that the order is the same every run)
+        self._heroes = defaultdict(dict)
+        self._monsters = defaultdict(dict)
+
+        self.weighted = template.weighted
+        # room id -> {connection id: (neighbouring room, connection)},
+        # only holding connections that are currently passable. Worked out
+        # for each room when first needed, see _adjacent.
+        self._adjacency = {}
+        if self.weighted:
+            # per room index: [(neighbour index, connection, cost)], likewise
+            self._edges = [None] * len(template.room_ids)
+
+        # destination room id -> next hop table, see get_routes
+        self.routing = routing
+        self._routes = {}
 
         self.spawn_probability = 0
+        self.max_entities = 5
+
+        self.clock = clock or time
+        self.random = random.Random(seed)
+        self.store = EntityStore(self.rooms, seed=seed) if store else None
+
+        self._awake = {}     # entity id -> entity, to update next time
+        self._timers = []    # heap of (time, number, entity), for waking them later
+        self._timer_count = count()
+
+    def _occupants(self, entity):
+        "The room occupancy index an entity belongs in."
+        return self._heroes if isinstance(entity, Hero) else self._monsters
+
+    def _enemies(self, entity):
+        "The room occupancy index of an entity's enemies."
+        return self._monsters if isinstance(entity, Hero) else self._heroes
+
+    def wake(self, entity):
+        "Make sure an entity gets updated next time, e.g. if it's been given orders."
+        self._awake[entity._id] = entity
+
+    def _wake_enemies(self, entity, room):
+        "Wake the enemies of an entity in a room, as it has come or gone."
+        self._awake.update(self._enemies(entity)[room._id])
+
+    def _schedule(self, entity, now):
+        "Decide when to update an entity next, unless it's woken before."
+        when = entity._wake_at = entity.wake_time()
+        if when is None:
+            return
+        if when <= now:
+            self._awake[entity._id] = entity
+        else:
+            heappush(self._timers, (when, next(self._timer_count), entity))
+
+    def place_entity(self, entity):
+        "Put a new entity on the level."
+        self.entities[entity._id] = entity
+        self._occupants(entity)[entity.room._id][entity._id] = entity
+        entity._journal = self.journal
+        if self.store is not None:
+            self.store.add(entity, HERO if isinstance(entity, Hero) else MONSTER)
+        self.journal.add("/entities/%s" % entity._id, entity.to_dict())
+        self.wake(entity)
+        self._wake_enemies(entity, entity.room)
+
+    def remove_entity(self, entity):
+        "Take an entity off the level."
+        del self.entities[entity._id]
+        del self._occupants(entity)[entity.room._id][entity._id]
+        entity._journal = None
+        if self.store is not None:
+            self.store.remove(entity)
+        self.journal.remove("/entities/%s" % entity._id)
+        self._awake.pop(entity._id, None)
+        entity._wake_at = None  # forget about any timer
+        self._wake_enemies(entity, entity.room)
+
+    def move_entity(self, entity, old_room):
+        "Keep track of an entity that has gone from one room to another."
+        occupants = self._occupants(entity)
+        del occupants[old_room._id][entity._id]
+        occupants[entity.room._id][entity._id] = entity
+        if self.store is not None:
+            self.store.move(entity)
+        self._wake_enemies(entity, old_room)
+        self._wake_enemies(entity, entity.room)
 
     def add_entities(self, data):
         for d in data:
-            self.entities[d["_id"]] = Entity.from_dict(self, d)
+            self.place_entity(Entity.from_dict(self, d))
+
+    def _adjacent(self, room_id):
+        "The passable connections from a room, in the adjacency index."
+        adjacent = self._adjacency.get(room_id)
+        if adjacent is None:
+            adjacent = self._adjacency[room_id] = {}
+            for conn_id, other in self.template.neighbours[room_id]:
+                conn = self.connections[conn_id]
+                if conn:
+                    adjacent[conn_id] = (self.rooms[other], conn)
+        return adjacent
+
+    def _weighted_edges(self, i):
+        "The passable connections from a room, by index, with their costs."
+        t = self.template
+        edges = self._edges[i] = [(t.room_index[room._id], conn, t.costs[conn._id])
+                                  for room, conn in self._adjacent(t.room_ids[i]).values()]
+        return edges
+
+    def _forget(self, conn):
+        "Drop what's known about the connections of the rooms a connection joins."
+        for room in conn.rooms:
+            self._adjacency.pop(room, None)
+            if self.weighted:
+                self._edges[self.template.room_index[room]] = None
+
+    def get_step_distance(self, room, conn):
+        "The distance of going from a room to its neighbour through a connection."
+        return self.template.costs[conn._id] if self.weighted else 1
 
     def get_connected_rooms(self, room):
         """
         Find out which rooms are accessible from a room, and how.
         Returns a set of tuples on the form (room, connection)
         """
-        if room in self.rooms:
-            room = self.rooms[room]
-        connected = set()
-        for conn in self.connections.values():
-            if conn and room._id in conn.rooms:
-                conn_room = (conn.rooms - set([room._id])).pop()
-                connected.add((self.rooms[conn_room], conn))
-        return connected
+        room_id = room if room in self.rooms else room._id
+        return set(self._adjacent(room_id).values())
+
+    def _build_routes(self, destination):
+        """
+        Run a breadth first search outwards from a destination room (or
+        Dijkstra's, if weighted). Returns a dict mapping each room id that
+        can reach the destination to a tuple (next room, connection,
+        distance to destination).
+        """
+        if self.weighted:
+            return self._build_weighted_routes(destination)
+        routes = {destination._id: (None, None, 0)}
+        queue = deque([destination._id])
+        while queue:
+            pos = queue.popleft()
+            dist = routes[pos][2] + 1
+            for room, conn in self._adjacent(pos).values():
+                if room._id not in routes:
+                    routes[room._id] = (self.rooms[pos], conn, dist)
+                    queue.append(room._id)
+        return routes
+
+    def _build_weighted_routes(self, destination):
+        "Like _build_routes, with the distances measured on the map."
+        routes = {}
+        costs = self.template.costs
+        order = count()  # so that ties never get to comparing rooms
+        heap = [(0.0, next(order), destination._id, None, None)]
+        while heap:
+            dist, _, pos, room, conn = heappop(heap)
+            if pos in routes:
+                continue  # already reached by a shorter way
+            routes[pos] = (room, conn, dist)
+            for other, conn in self._adjacent(pos).values():
+                if other._id not in routes:
+                    heappush(heap, (dist + costs[conn._id], next(order), other._id,
+                                    self.rooms[pos], conn))
+        return routes
+
+    def get_routes(self, destination):
+        "Return the (cached, if routing is on) next hop table for a room."
+        if not self.routing:
+            return self._build_routes(destination)
+        routes = self._routes.get(destination._id)
+        if routes is None:
+            routes = self._routes[destination._id] = self._build_routes(destination)
+        return routes
+
+    def _invalidate_routes(self, conn):
+        "Drop the cached routing tables affected by a connection changing."
+        room1, room2 = conn.rooms
+        for dest_id, routes in self._routes.items():
+            hop1, hop2 = routes.get(room1), routes.get(room2)
+            if conn:
+                # a new passage only matters if it makes some route shorter
+                step = self.get_step_distance(None, conn)
+                stale = (hop1 or hop2) and (not hop1 or not hop2 or
+                                            abs(hop1[2] - hop2[2]) > step)
+            else:
+                # a closed passage only matters if some route went through it
+                stale = ((hop1 and hop1[1] is conn) or
+                         (hop2 and hop2[1] is conn))
+            if stale:
+                del self._routes[dest_id]
+
+    def get_weighted_path(self, room1, room2):
+        """
+        Find the shortest path from room1 to room2 on the map, using A*.
+        Returns a list of tuples on the form (room, connection, distance)
+        """
+        t = self.template
+        start, goal = t.room_index[room1._id], t.room_index[room2._id]
+        xs, ys, edges, scale = t.xs, t.ys, self._edges, t.scale
+        stamp, closed, g = t._stamp, t._closed, t._g
+        came_from, via = t._came_from, t._via
+        t._search += 1
+        search = t._search
+        goal_x, goal_y = xs[goal], ys[goal]
+
+        stamp[start], g[start], came_from[start] = search, 0.0, -1
+        heap = [(0.0, start)]
+        while heap:
+            _, i = heappop(heap)
+            if i == goal:
+                break
+            if closed[i] == search:
+                continue  # an outdated heap entry
+            closed[i] = search
+            g_i = g[i]
+            for j, conn, cost in edges[i] or self._weighted_edges(i):
+                if closed[j] == search:
+                    continue
+                g_j = g_i + cost
+                if stamp[j] != search or g_j < g[j]:
+                    stamp[j], g[j], came_from[j], via[j] = search, g_j, i, conn
+                    heappush(heap, (g_j + hypot(xs[j] - goal_x, ys[j] - goal_y) / scale, j))
+        else:
+            return None
+
+        path = []
+        i = goal
+        while i != start:
+            path.append((self.rooms[t.room_ids[i]], via[i], t.costs[via[i]._id]))
+            i = came_from[i]
+        path.reverse()
+        return path
 
     def get_shortest_path(self, room1, room2):
         """
         Find the/a shortest path from room1 to room2.
         Returns a list of tuples on the form (room, connection, distance)
         """
-        queue = OrderedDict({room2._id: 0})
-        i = 0
-        while i < len(queue):
-            pos, step = queue.items()[i]
-            if pos == room1._id:  # we're there
-                print "there"
-                path = []
-                nearest = queue[pos]
-                while pos != room2._id:
-                    connected = self.get_connected_rooms(pos)
-                    for room, conn in connected:
-                        dist = queue.get(room._id)
-                        if room == room2 or (dist and dist < nearest):
-                            nearest = dist
-                            pos = room._id
-                            the_conn = conn
-                            dist_delta = 1  # should use actual distance on map
-                    path.append((self.rooms[pos], the_conn, dist_delta))
-                return path
-            for room, conn in self.get_connected_rooms(pos):
-                old = queue.get(room._id)
-                totdist = step + 1
-                if old is None or old > totdist:
-                    queue[room._id] = totdist
-            i += 1
-        return None
+        if self.weighted and not self.routing:
+            return self.get_weighted_path(room1, room2)
+        routes = self.get_routes(room2)
+        if room1._id not in routes:
+            return None
+        path = []
+        pos = room1._id
+        while pos != room2._id:
+            room, conn, _ = routes[pos]
+            path.append((room, conn, self.get_step_distance(room, conn)))
+            pos = room._id
+        return path
+
+    def _due_entities(self, now):
+        "Take the entities to update: the ones woken, and the ones whose time is up."
+        due, self._awake = self._awake, {}
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            when, _, entity = heappop(timers)
+            if entity._wake_at == when:  # otherwise, it's been rescheduled
+                due[entity._id] = entity
+        return due.values()
 
     def update_entities(self):
-        "Go through all entities and check if they change state, etc."
-        changed = [e for e in self.entities.values() if e.update()]
-        self.reap_entities()
-        if random.random() < self.spawn_probability and len(self.entities) < 5:
-            print "spawn monster"
-            monster = Monster(level=self, room=random.choice(self.rooms.values()))
-            self.entities[monster._id] = monster
+        """
+        Update the entities that are due, checking if they change state,
+        etc. Entities woken meanwhile are updated the next time.
+        """
+        now = self.clock.time()
+        due = self._due_entities(now)
+        for entity in due:
+            if self.entities.get(entity._id) is entity:
+                entity.update()
+                self._schedule(entity, now)
+        if self.store is not None:
+            for entity in self.store.fight(now):
+                entity._record("health", entity.health)
+                self.wake(entity)
+        self.reap_entities(due)
+        if (self.random.random() < self.spawn_probability and
+                len(self.entities) < self.max_entities):
+            _id = str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+            monster = Monster(_id=_id, level=self, room=self.random.choice(self.rooms.values()))
+            self.log.info("spawn", "in %s", monster.room._id, entity=monster._id)
+            self.place_entity(monster)
         return True
 
-    def reap_entities(self):
-        "Remove dead entities."
-        for _id, entity in self.entities.items():
-            if entity.state == "DEAD":
-                del self.entities[_id]
+    def reap_entities(self, entities=None):
+        "Remove dead entities, among the given ones or all of them."
+        for entity in list(self.entities.values() if entities is None else entities):
+            if entity.state == "DEAD" and self.entities.get(entity._id) is entity:
+                self.remove_entity(entity)
+
+    def can_toggle_door(self, door_id):
+        "Whether toggle_door would work. None if it's not a door at all."
+        conn = self.connections[door_id]
+        if conn.door:
+            return not conn.locked
 
     def toggle_door(self, door_id):
         "Open a door if closed (and unlocked), and vice versa."
@@ -135,30 +582,42 @@ class Level(object):
                 return False
             else:
                 conn.opened = not conn.opened
+                self._forget(conn)
+                self._invalidate_routes(conn)
                 return True
 
     def get_entities(self, room):
         "Return the list of entities occupying a room."
-        return [e for e in self.entities.values() if e.room == room]
+        return self._heroes[room._id].values() + self._monsters[room._id].values()
 
-    def to_dict(self):
+    def get_connections(self, room):
+        "Return all the connections to a room, passable or not."
+        return [self.connections[_id] for _id, _ in self.template.neighbours[room._id]]
+
+    def get_heroes(self, room):
+        "Return the list of heroes occupying a room."
+        return self._heroes[room._id].values()
+
+    def get_monsters(self, room):
+        "Return the list of monsters occupying a room."
+        return self._monsters[room._id].values()
+
+    def to_dict(self, entities=None):
+        "A dict representation, with all entities unless given a list of them."
         d = {}
         d["rooms"] = dict((_id, room.to_dict())
                           for _id, room in self.rooms.items())
         d["connections"] = dict((_id, conn.to_dict())
                                 for _id, conn in self.connections.items())
-        d["entities"] = dict((_id, ent.to_dict())
-                             for _id, ent in self.entities.items())
+        entities = self.entities.values() if entities is None else entities
+        d["entities"] = dict((ent._id, ent.to_dict()) for ent in entities)
         return d
 
     @classmethod
-    def from_dict(cls, data):
-        "Create an instance of this class from a dict of properties."
-        _id = data["_id"]
-        rooms = [Room(_id, room.get("items", []))
-                 for _id, room in data["rooms"].items()]
-        connections = [Connection(_id, door=conn.get("door"), rooms=conn.get("rooms", []))
-                       for _id, conn in data["connections"].items()]
-        level = cls(_id, rooms, connections)
-        level.add_entities(deepcopy(data["entities"]))
-        return level
+    def from_dict(cls, data, **kwargs):
+        """
+        Create an instance of this class from a dict of properties.
+        Paths are weighted by default if the data has the geometry for it.
+        For making many levels from the same data, see LevelTemplate.
+        """
+        return LevelTemplate.from_dict(data, kwargs.pop("weighted", None)).create(**kwargs)
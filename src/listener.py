@@ -0,0 +1,122 @@
+"""
+The queues of event frames waiting to be sent to each client.
+
+A client that doesn't keep up must not make the server hold on to an
+ever growing pile of frames. When too many frames are waiting, the
+patches among them are merged into one, and if the client is far enough
+behind they are all replaced by a snapshot of the full game state.
+A client that hasn't taken anything for a long time is dropped.
+"""
+
+from collections import deque
+import json
+import time
+
+from gevent.event import Event
+
+from journal import Journal
+
+
+def encode_event(data, event_id):
+    "Encode event data as a server-sent event frame, ready to send."
+    return "id: %d\ndata: %s\n\n" % (event_id, json.dumps(data))
+
+
+def decode_event(frame):
+    "Get the event id and data back from an encoded frame."
+    event_id, data = frame.split("\n", 1)
+    return int(event_id[4:]), json.loads(data[6:])
+
+
+def is_patch(frame):
+    "Check if a frame is a patch, rather than a full state."
+    return frame.partition("\n")[2].startswith('data: {"patch": ')
+
+
+def merge_patches(patches):
+    "Merge several lists of patch operations into one with the same effect."
+    journal = Journal()
+    for patch in patches:
+        for op in patch:
+            if op["op"] == "remove":
+                journal.remove(op["path"])
+            else:
+                getattr(journal, op["op"])(op["path"], op["value"])
+    return journal.flush()
+
+
+class Listener(object):
+
+    """
+    A bounded queue of frames for one client.
+
+    'snapshot' is a function returning a frame with the full current
+    state. Without it, a lagging client only gets its patches merged.
+    """
+
+    def __init__(self, snapshot=None, max_pending=10, max_behind=100, drop_after=60.0):
+        self.snapshot = snapshot
+        self.max_pending = max_pending  # frames waiting before merging them
+        self.max_behind = max_behind    # events behind before a snapshot is better
+        self.drop_after = drop_after    # seconds without taking anything
+        self.dropped = False
+        self._pending = deque()  # [frame, number of events in it]
+        self._behind = 0         # events waiting in total
+        self._last_read = time.time()
+        self._ready = Event()
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def lag(self):
+        "How many events the client has yet to get, and how long since it took one."
+        return self._behind, (time.time() - self._last_read if self._pending else 0.0)
+
+    def put(self, frame):
+        "Queue a frame for sending."
+        if self.dropped:
+            return
+        self._pending.append([frame, 1])
+        self._behind += 1
+        if len(self._pending) > self.max_pending:
+            if time.time() - self._last_read > self.drop_after:
+                self.drop()
+                return
+            if self.snapshot and self._behind > self.max_behind:
+                self._pending = deque([[self.snapshot(), self._behind]])
+            else:
+                self._merge()
+        self._ready.set()
+
+    def _merge(self):
+        "Merge all the patches waiting after the last full state frame."
+        start = len(self._pending)
+        while start > 0 and is_patch(self._pending[start - 1][0]):
+            start -= 1
+        if len(self._pending) - start < 2:
+            return
+        tail = [self._pending.pop() for _ in range(len(self._pending) - start)][::-1]
+        events = [decode_event(frame) for frame, _ in tail]
+        patch = merge_patches(data["patch"] for _, data in events)
+        self._pending.append([encode_event({"patch": patch}, events[-1][0]),
+                              sum(n for _, n in tail)])
+
+    def drop(self):
+        "Give up on the client."
+        self.dropped = True
+        self._pending.clear()
+        self._behind = 0
+        self._ready.set()  # wake up the client, so that it can go away
+
+    def get(self):
+        "Wait for the next frame. Returns None if the client has been dropped."
+        while not self._pending and not self.dropped:
+            self._ready.clear()
+            self._ready.wait()
+        self._last_read = time.time()
+        if self.dropped:
+            return None
+        frame, events = self._pending.popleft()
+        self._behind -= events
+        return frame
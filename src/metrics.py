@@ -0,0 +1,182 @@
+"""
+Timings and counts from the running games, for keeping an eye on how
+the server is doing.
+
+Each game keeps its own GameMetrics, updated as it runs. Timings go into
+histograms with fixed buckets, so recording one is a couple of additions
+and nothing is allocated, whether anyone is looking or not. The rest
+(entities, listeners, queue depths...) is read off the games when the
+metrics are rendered, in the Prometheus text format:
+
+> render(games)
+--> "# TYPE controlroom_phase_seconds histogram\\n..."
+
+Everything is given per game (with a "game" label), and also summed up
+over all the games in the process.
+"""
+
+from bisect import bisect_left
+
+
+# Upper bounds of the buckets for timings, in seconds
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# ...and for the number of operations in a patch
+OPS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# The parts of running a game that are timed
+PHASES = ("tick", "commands", "entities", "journal", "broadcast", "encode", "to_dict")
+
+
+class Histogram(object):
+
+    "Counts of values falling in each of a fixed set of buckets."
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is for anything bigger
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, other):
+        "Add the counts of another histogram with the same buckets."
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+
+class GameMetrics(object):
+
+    "What one game records about itself as it runs."
+
+    def __init__(self):
+        self.phases = dict((phase, Histogram()) for phase in PHASES)
+        self.ops = Histogram(OPS_BUCKETS)  # per patch
+        self.events = 0    # events broadcast
+        self.dropped = 0   # listeners dropped for falling behind
+
+    def time(self, phase, seconds):
+        self.phases[phase].observe(seconds)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % item for item in sorted(labels.items()))
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family(object):
+
+    "The samples of one metric, for rendering."
+
+    def __init__(self, name, kind, help):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.lines = []
+
+    def sample(self, value, suffix="", **labels):
+        self.lines.append("%s%s%s %s" % (self.name, suffix, _labels(labels),
+                                         _format_value(value)))
+
+    def histogram(self, histogram, **labels):
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += n
+            self.sample(cumulative, "_bucket", le=bound, **labels)
+        self.sample(histogram.sum, "_sum", **labels)
+        self.sample(histogram.count, "_count", **labels)
+
+    def render(self):
+        return "\n".join(["# HELP %s %s" % (self.name, self.help),
+                          "# TYPE %s %s" % (self.name, self.kind)] + self.lines)
+
+
+def _listeners(game):
+    "The listener queues of a game, by kind."
+    return [("json", game.queues), ("compact", game.compact_queues),
+            ("hero", [q for view in game.views.values() for q in view.listeners])]
+
+
+def render(games):
+    "The metrics of the given games, and of all of them together, as text."
+    games = [game for game in games if getattr(game, "metrics", None)]
+
+    phases = _Family("controlroom_phase_seconds", "histogram",
+                     "Time spent in each part of running a game.")
+    ops = _Family("controlroom_patch_ops", "histogram",
+                  "Number of operations in each patch sent.")
+    ticks = _Family("controlroom_ticks_total", "counter", "Ticks run.")
+    skipped = _Family("controlroom_ticks_skipped_total", "counter",
+                      "Ticks skipped to get back on schedule.")
+    lag = _Family("controlroom_tick_lag_seconds", "gauge", "How late the last tick started.")
+    events = _Family("controlroom_events_total", "counter", "Events broadcast.")
+    dropped = _Family("controlroom_listeners_dropped_total", "counter",
+                      "Listeners dropped for falling behind.")
+    entities = _Family("controlroom_entities", "gauge", "Entities in the level.")
+    listeners = _Family("controlroom_listeners", "gauge", "Listeners, by kind.")
+    depth = _Family("controlroom_queue_depth", "gauge",
+                    "Events waiting to be sent, summed over the listeners.")
+    max_depth = _Family("controlroom_queue_depth_max", "gauge",
+                        "Events waiting to be sent, for the furthest behind listener.")
+    commands = _Family("controlroom_commands_queued", "gauge",
+                       "Commands waiting for the next tick.")
+    running = _Family("controlroom_games", "gauge", "Games in the process.")
+
+    simple = [(ticks, "ticks"), (skipped, "skipped"), (events, "events"),
+              (dropped, "dropped"), (entities, "entities"), (depth, "depth"),
+              (max_depth, "max_depth"), (commands, "commands")]
+
+    total_phases = dict((phase, Histogram()) for phase in PHASES)
+    total_ops = Histogram(OPS_BUCKETS)
+    totals = dict(ticks=0, skipped=0, events=0, dropped=0, entities=0, depth=0,
+                  max_depth=0, commands=0)
+    total_listeners = dict(json=0, compact=0, hero=0)
+
+    for game in games:
+        metrics, game_id = game.metrics, str(game._id)
+        for phase in PHASES:
+            phases.histogram(metrics.phases[phase], game=game_id, phase=phase)
+            total_phases[phase].add(metrics.phases[phase])
+        ops.histogram(metrics.ops, game=game_id)
+        total_ops.add(metrics.ops)
+        behind = []
+        for kind, queues in _listeners(game):
+            listeners.sample(len(queues), game=game_id, kind=kind)
+            total_listeners[kind] += len(queues)
+            behind.extend(queue.lag[0] for queue in queues)
+        values = dict(ticks=game.stats.ticks, skipped=game.stats.skipped,
+                      events=metrics.events, dropped=metrics.dropped,
+                      entities=len(game.level.entities), depth=sum(behind),
+                      max_depth=max(behind or [0]), commands=len(game.commands))
+        for family, key in simple:
+            family.sample(values[key], game=game_id)
+            if key == "max_depth":
+                totals[key] = max(totals[key], values[key])
+            else:
+                totals[key] += values[key]
+        lag.sample(game.stats.lag, game=game_id)
+
+    # the whole process
+    for phase in PHASES:
+        phases.histogram(total_phases[phase], game="all", phase=phase)
+    ops.histogram(total_ops, game="all")
+    for family, key in simple:
+        family.sample(totals[key], game="all")
+    for kind, n in sorted(total_listeners.items()):
+        listeners.sample(n, game="all", kind=kind)
+    running.sample(len(games))
+
+    families = [phases, ops, ticks, skipped, lag, events, dropped, entities,
+                listeners, depth, max_depth, commands, running]
+    return "\n".join(family.render() for family in families) + "\n"
@@ -0,0 +1,295 @@
+"""
+Recording games as they're played, and replaying them.
+
+A recording is a file of records, appended one after the other:
+
+  header:  1 byte kind, 4 bytes tick, 4 bytes length (little endian)
+  payload: 'length' bytes, depending on the kind
+
+ - a snapshot ("S") is the full state of the level after 'tick' ticks,
+   as zlib compressed JSON, along with the ids used in the ticks that
+   follow (see wire.py) and the game's period
+ - a tick ("T") is what happened during tick number 'tick': the commands
+   carried out, then the patch operations, packed like compact events
+   (wire.py), with the ids replaced by numbers. Ticks where nothing
+   happened aren't recorded.
+
+There's a snapshot at the start, and then every 'snapshot_interval'
+ticks (whether anything happened or not), so that a replay can start
+anywhere without going through all the ticks before.
+
+On the game loop, recording a tick is only a matter of putting its
+commands and operations in a queue. Packing and writing happens in the
+background, where the recorder keeps its own copy of the game state
+(by applying the operations) to take the snapshots from:
+
+> game.record("game.rec")  # makes a Recorder
+> ...
+> replay = Replay("game.rec")
+> replay.state(tick=120)  # as Level.to_dict()
+> replay.stream(start=120, speed=2.0)  # server-sent event frames, in time
+"""
+
+from bisect import bisect_right
+from collections import deque
+from copy import deepcopy
+import json
+import mmap
+import struct
+import threading
+import zlib
+
+import gevent
+
+from listener import encode_event
+from wire import CompactEncoder, CompactDecoder, pack_varint, unpack_varint
+
+
+MAGIC = "CRREC1\n"
+HEADER = struct.Struct("<cII")  # kind, tick, length
+SNAPSHOT, TICK = "S", "T"
+
+# the commands that can be recorded, and what their arguments are ids of
+COMMANDS = ["toggle_door", "move_entity"]
+ARGUMENTS = {"toggle_door": ("connections",), "move_entity": ("entities", "rooms")}
+
+
+def apply_ops(state, ops):
+    "Apply patch operations (as made by the journal) to a level dict, in place."
+    for op in ops:
+        parts = op["path"].split("/")[1:]
+        target = state
+        for part in parts[:-1]:
+            target = target[part]
+        if op["op"] == "remove":
+            del target[parts[-1]]
+        elif op["op"] == "add":
+            target[parts[-1]] = deepcopy(op["value"])  # may be changed later
+        else:
+            target[parts[-1]] = op["value"]
+
+
+class Recorder(object):
+
+    """
+    Writes a recording of a level, from its current state on. Ticks are
+    written out every 'interval' seconds, by a background thread. The
+    'period' of the game is kept in the recording, for replaying in time.
+
+    A recorder can be closed while the game isn't running, and reopened
+    to carry on with the same recording.
+    """
+
+    def __init__(self, path, level, tick=0, snapshot_interval=100, interval=1.0, period=1.0):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.period = period
+        self._pending = deque()  # (tick, commands, ops) not written yet
+        self._ticks = tick       # ticks done, including the ones not written yet
+        self._snapshot_tick = tick
+        self._encoder = CompactEncoder(level)  # only used for its ids
+        self._state = level.to_dict()  # what the level looks like, as written so far
+        self._lock = threading.Lock()  # around writing
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._write_snapshot(tick)
+        self._file.flush()  # so that it can be replayed right away
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._start_writer()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def reopen(self):
+        "Carry on recording after being closed."
+        self._file = open(self.path, "ab")
+        self._start_writer()
+
+    def _start_writer(self):
+        self._stopped.clear()
+        self._writer = threading.Thread(target=self._write_every, args=(self.interval,))
+        self._writer.daemon = True
+        self._writer.start()
+
+    def tick(self, tick, commands, ops):
+        "Record a tick: the commands carried out, as (name, args), and the changes."
+        if commands or ops:
+            self._pending.append((tick, commands, ops))
+        self._ticks = tick + 1  # after queueing it, see flush
+
+    def close(self):
+        "Write what's left, and stop writing."
+        self._stopped.set()
+        self._writer.join()
+        self.flush()
+        self._file.close()
+
+    def _write_every(self, interval):
+        while not self._stopped.wait(interval):
+            self.flush()
+
+    def flush(self):
+        "Write out the ticks recorded so far."
+        with self._lock:
+            if self._file.closed:
+                return
+            ticks = self._ticks  # all the ticks before are queued by now
+            pending = self._pending
+            while pending and pending[0][0] < ticks:
+                tick, commands, ops = pending.popleft()
+                self._snapshot_if_due(tick)
+                self._write_tick(tick, commands, ops)
+                apply_ops(self._state, ops)
+            self._snapshot_if_due(ticks)
+            self._file.flush()
+
+    def _snapshot_if_due(self, tick):
+        """
+        Write the snapshot that's due by 'tick' ticks, if any. Nothing has
+        changed since the ticks written so far, so the state is the same at
+        the tick the snapshot was due.
+        """
+        due = tick - (tick - self._snapshot_tick) % self.snapshot_interval
+        if due > self._snapshot_tick:
+            self._write_snapshot(due)
+
+    def _write(self, kind, tick, payload):
+        self._file.write(HEADER.pack(kind, tick, len(payload)))
+        self._file.write(payload)
+
+    def _write_snapshot(self, tick):
+        entities = self._encoder.interners["entities"]
+        for _id in self._state["entities"]:
+            entities.get(_id)
+        data = {"data": self._state, "ids": self._encoder.ids(), "period": self.period}
+        self._write(SNAPSHOT, tick, zlib.compress(json.dumps(data)))
+        self._snapshot_tick = tick
+
+    def _write_tick(self, tick, commands, ops):
+        interners = self._encoder.interners
+        out = bytearray()
+        pack_varint(len(commands), out)
+        for name, args in commands:
+            out.append(COMMANDS.index(name))
+            for kind, arg in zip(ARGUMENTS[name], args):
+                pack_varint(interners[kind].get(arg), out)
+        for op in ops:
+            self._encoder.encode_op(op, out)
+        self._write(TICK, tick, bytes(out))
+
+
+class Replay(object):
+
+    """
+    Reads a recording. The file is memory mapped, and only the records
+    needed are unpacked. A recording that's still being written can be
+    read, as far as it had got when opened.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a recording: %s" % path)
+        self.snapshots = []  # (tick, offset, length), in order
+        self.ticks = []      # likewise
+        self._index(len(MAGIC))
+        self.period = self._load(self.snapshots[0]).get("period", 1.0)  # seconds per tick
+
+    def _index(self, pos):
+        "Find the records, from 'pos' on, without unpacking them."
+        data, end = self._data, len(self._data)
+        while pos + HEADER.size <= end:
+            kind, tick, length = HEADER.unpack_from(data, pos)
+            pos += HEADER.size
+            if pos + length > end:
+                break  # not all written yet
+            (self.snapshots if kind == SNAPSHOT else self.ticks).append((tick, pos, length))
+            pos += length
+
+    @property
+    def length(self):
+        "The number of ticks recorded."
+        return max(self.snapshots[-1][0], self.ticks[-1][0] + 1 if self.ticks else 0)
+
+    def _snapshot(self, tick):
+        "The state and decoder at the last snapshot up to 'tick', and its tick."
+        i = bisect_right(self.snapshots, (tick, float("inf"))) - 1
+        snapshot = self.snapshots[max(i, 0)]
+        data = self._load(snapshot)
+        return snapshot[0], data["data"], CompactDecoder(data["ids"])
+
+    def _load(self, snapshot):
+        "Unpack a snapshot record."
+        _, offset, length = snapshot
+        return json.loads(zlib.decompress(self._data[offset:offset + length]))
+
+    def _read_tick(self, decoder, offset, length):
+        "Unpack a tick record into its commands and its patch operations."
+        data = bytearray(self._data[offset:offset + length])
+        count, pos = unpack_varint(data, 0)
+        commands = []
+        for _ in range(count):
+            name = COMMANDS[data[pos]]
+            pos += 1
+            args = []
+            for kind in ARGUMENTS[name]:
+                number, pos = unpack_varint(data, pos)
+                args.append(decoder.ids[kind][number])
+            commands.append((name, args))
+        ops = []
+        while pos < len(data):
+            op, pos = decoder.decode_op(data, pos)
+            ops.append(op)
+        return commands, ops
+
+    def _replay(self, start):
+        """
+        The state after 'start' ticks, followed by (tick, commands, ops) for
+        each tick from then on.
+        """
+        tick, state, decoder = self._snapshot(start)
+        start = max(start, tick)  # can't go back further than the recording
+        i = bisect_right(self.ticks, (tick, -1))
+        ticks = iter(self.ticks[i:])
+        for tick, offset, length in ticks:
+            if tick >= start:
+                break
+            apply_ops(state, self._read_tick(decoder, offset, length)[1])
+        else:
+            tick = None
+        yield state
+        while tick is not None:
+            commands, ops = self._read_tick(decoder, offset, length)
+            yield tick, commands, ops
+            tick, offset, length = next(ticks, (None, None, None))
+
+    def state(self, tick):
+        "The level as it was after a number of ticks, as a dict (see Level.to_dict)."
+        return next(self._replay(tick))
+
+    def events(self, start=0):
+        "The ticks from 'start' on, as (tick, commands, ops), after the state to start from."
+        return self._replay(start)
+
+    def stream(self, start=0, period=None, speed=1.0):
+        """
+        Play back the recording as server-sent event frames, like a game's:
+        the state to start from, then the changes, at the pace they were
+        made (ticks 'period' seconds apart, by default as recorded), sped up
+        by 'speed'. Event ids are tick numbers.
+        """
+        if speed <= 0:
+            raise ValueError("The speed must be positive")
+        period = self.period if period is None else period
+        start = max(start, self.snapshots[0][0])
+        events = self.events(start)
+        yield encode_event({"data": next(events)}, start)
+        last = start
+        for tick, commands, ops in events:
+            gevent.sleep(max(0, tick - last) * period / speed)
+            last = tick
+            if ops:
+                yield encode_event({"patch": ops}, tick + 1)
@@ -0,0 +1,124 @@
+"""
+Runs the ticks of many games from a single greenlet, instead of each game
+running its own loop.
+
+Games are kept in a heap ordered by when their next tick is due. The
+scheduler sleeps until the first one is due, and then runs the ticks of
+all games that are due, up to a limit, before giving other greenlets
+(e.g. the listeners) a chance to run.
+
+> scheduler = GameScheduler()
+> game = Game(data=data, scheduler=scheduler)
+> scheduler.add(game)  # normally done by game.listen()
+"""
+
+import heapq
+from itertools import count
+import time
+import traceback
+
+import gevent
+from gevent.event import Event
+
+from eventlog import ERROR
+
+
+# Consecutive multiples of this, modulo 1, are spread out evenly
+GOLDEN_RATIO = 0.6180339887498949
+
+
+class GameScheduler(object):
+
+    "Keeps track of when games are due to tick, and runs them."
+
+    def __init__(self, max_ticks=100, autostart=True, failed=None):
+        self.max_ticks = max_ticks  # most game ticks to run per wakeup
+        self.autostart = autostart  # else, call run_due from somewhere
+        self.failed = failed        # called with a game whose tick failed, if set
+        self._heap = []      # (deadline, sequence number, game)
+        self._games = {}     # scheduled game -> sequence number of its entry
+        self._sequence = count()
+        self._phase = 0.0
+        self._main = None
+        self._wakeup = Event()
+
+    def __contains__(self, game):
+        return game in self._games
+
+    def __len__(self):
+        return len(self._games)
+
+    def add(self, game):
+        """
+        Start running a game. The first tick is offset by part of a period,
+        so that games added at the same time don't tick at the same time.
+        """
+        if game in self._games:
+            return
+        self._phase = (self._phase + GOLDEN_RATIO) % 1.0
+        game._deadline = time.time() + (1 + self._phase) * game.period
+        self._push(game)
+        if self.autostart and self._main is None:
+            self._main = gevent.spawn(self._run)
+
+    def remove(self, game):
+        "Stop running a game. Its entry is left in the heap, but skipped."
+        self._games.pop(game, None)
+
+    def _push(self, game):
+        first = self._heap[0][0] if self._heap else None
+        sequence = self._games[game] = next(self._sequence)
+        heapq.heappush(self._heap, (game._deadline, sequence, game))
+        if first is None or game._deadline < first:
+            self._wakeup.set()  # the main loop may need to wake up earlier
+
+    def _is_current(self, entry):
+        "Check that a heap entry is not left over from a removed game."
+        return self._games.get(entry[2]) == entry[1]
+
+    def next_deadline(self):
+        "When the next game is due, or None if there are no games."
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now=None):
+        "Run the games that are due, up to the limit. Returns the number run."
+        now = time.time() if now is None else now
+        ran = 0
+        while self._heap and ran < self.max_ticks:
+            deadline, _, game = entry = self._heap[0]
+            if not self._is_current(entry):
+                heapq.heappop(self._heap)
+                continue
+            if deadline > now:
+                break
+            heapq.heappop(self._heap)
+            try:
+                game.step(now)
+            except Exception:
+                # only this game stops, the others keep going
+                game.log.log(ERROR, "tick", "stopped after an error: %s",
+                             traceback.format_exc())
+                self.remove(game)
+                if self.failed is not None:
+                    self.failed(game)
+            ran += 1
+            if game in self._games:  # it may have stopped
+                self._push(game)
+        return ran
+
+    def _run(self):
+        "The main loop."
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                self._wakeup.wait()
+                continue
+            delay = deadline - time.time()
+            if delay > 0:
+                self._wakeup.wait(delay)
+                continue
+            self.run_due()
+            gevent.sleep(0)  # let others run between batches
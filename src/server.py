@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 
-from copy import deepcopy
 import json
 import logging
+import os
 from random import choice
 
 import gevent
 import gevent.monkey
 from gevent.pywsgi import WSGIServer
+from geventwebsocket.handler import WebSocketHandler
 gevent.monkey.patch_all()
 
 import werkzeug.serving
 from flask import Flask, request, Response, render_template, jsonify
 
+from channel import Channel
+import eventlog
 from game import Game, GameDataEncoder
+from level import LevelTemplate
+import metrics
+from recording import Replay
+from scheduler import GameScheduler
+from shards import ShardPool
 
 
 app = Flask(__name__)
@@ -32,20 +40,64 @@ game_data["entities"] = [
      "room": choice(game_data["rooms"].keys())},
 ]
 
+# what all the games on the map have in common, worked out once
+level_template = LevelTemplate.from_dict(game_data)
+
+# Set CONTROLROOM_SHARDS to run the games in that many worker processes
+SHARDS = int(os.environ.get("CONTROLROOM_SHARDS", 0))
+# Set CONTROLROOM_RECORDINGS to a directory to record the games there
+RECORDINGS = os.environ.get("CONTROLROOM_RECORDINGS")
+
 games = {}
+scheduler = GameScheduler()  # runs all the games
+shard_pool = ShardPool(SHARDS, log_path="events.%d.log") if SHARDS else None
 
 
 @app.route('/listen_game/<int:game_id>', methods=['GET'])
 def listen_game(game_id):
     if game_id in games:
-        return Response(games[game_id].listen(),
+        # set by the browser when reconnecting, so we can send only what it missed
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id and last_event_id.isdigit():
+            last_event_id = int(last_event_id)
+        else:
+            last_event_id = None
+        # a client may only be interested in what a hero can see
+        hero = request.args.get("hero")
+        # ...and may want the changes in a compact format, see wire.py
+        format = request.args.get("format", "json")
+        return Response(games[game_id].listen(last_event_id, hero, format),
                         mimetype='text/event-stream')
 
 
+@app.route('/replay/<int:game_id>', methods=['GET'])
+def replay_game(game_id):
+    # spectate a recorded game, from a given tick and as fast as wanted
+    path = os.path.join(RECORDINGS or "", "%d.rec" % game_id)
+    if not RECORDINGS or not os.path.exists(path):
+        return Response(status=404)
+    start = request.args.get("from", 0, type=int)
+    speed = request.args.get("speed", 1.0, type=float)
+    if speed <= 0:
+        return Response("speed must be positive", status=400)
+    return Response(Replay(path).stream(start, speed=speed), mimetype='text/event-stream')
+
+
+@app.route('/metrics')
+def get_metrics():
+    # in the Prometheus text format, see metrics.py
+    return Response(metrics.render(games.values()), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/<int:game_id>')
 def get_client(game_id):
     if game_id not in games:
-        game = Game(data=deepcopy(game_data))
+        if shard_pool:
+            game = shard_pool.create_game(game_id, game_data)
+        else:
+            game = Game(game_id, level_template, scheduler=scheduler)
+            if RECORDINGS:
+                game.record(os.path.join(RECORDINGS, "%d.rec" % game_id))
         games[game_id] = game
     #return render_template('test_client.html')
     return render_template('client.html', game_id=game_id)
@@ -54,7 +106,7 @@ def get_client(game_id):
 @app.route('/<int:game_id>/door/<door_id>/toggle')
 def toggle_door(game_id, door_id):
     if game_id in games:
-        result = games[game_id].level.toggle_door(door_id)
+        result = games[game_id].toggle_door(door_id)
         return jsonify(result=result)
     return False
 
@@ -62,23 +114,33 @@ def toggle_door(game_id, door_id):
 @app.route('/<int:game_id>/entity/<entity_id>/move/<room_id>')
 def move_hero(game_id, entity_id, room_id):
     if game_id in games:
-        level = games[game_id].level
-        entity = level.entities[entity_id]
-        room = level.rooms[room_id]
-        success = entity.set_destination(level, room)
+        success = games[game_id].move_entity(entity_id, room_id)
         return jsonify(result=success)
     return False
 
 
-@werkzeug.serving.run_with_reloader
+@app.route('/<int:game_id>/socket')
+def game_socket(game_id):
+    # commands (and optionally events) over a WebSocket, see channel.py
+    socket = request.environ.get("wsgi.websocket")
+    if game_id in games and socket is not None:
+        channel = Channel(games[game_id], socket)
+        if request.args.get("events"):  # instead of /listen_game
+            channel.push_events(hero=request.args.get("hero"),
+                                format=request.args.get("format", "json"))
+        channel.serve()
+    return Response()
+
+
 def main():
     handler = logging.FileHandler('server.log')
     handler.setLevel(logging.DEBUG)
     app.logger.setLevel(logging.DEBUG)
     app.logger.addHandler(handler)
-    http_server = WSGIServer(('127.0.0.1', 8001), app)
+    eventlog.log.open('events.log')
+    http_server = WSGIServer(('127.0.0.1', 8001), app, handler_class=WebSocketHandler)
     http_server.serve_forever()
 
 
 if __name__ == '__main__':
-    main()
+    werkzeug.serving.run_with_reloader(main)  # not on import, see scripts/load_sse.py
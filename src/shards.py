@@ -0,0 +1,312 @@
+"""
+Running games in a pool of worker processes, so that the simulation can
+use more than one core.
+
+Each game belongs to one worker, picked by a hash of the game id. The
+worker runs the game's ticks and sends the encoded event frames back
+through a pipe. On the server side, a RemoteGame stands in for the Game
+and has the same interface: listen(), toggle_door() and move_entity().
+Commands are forwarded to the owning worker, and the results come back
+through the same pipe.
+
+> pool = ShardPool(4, log_path="events.%d.log")
+> game = pool.create_game(game_id, data)
+> game.toggle_door("door1")
+"""
+
+from itertools import count
+from multiprocessing import Process, Pipe
+import time
+import traceback
+import zlib
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.socket import wait_read
+
+import eventlog
+from eventlog import GameLog, ERROR
+from game import Game
+from listener import Listener
+from scheduler import GameScheduler
+
+
+class ShardError(Exception):
+
+    "A command could not be carried out by the worker running the game."
+
+
+class ShardPool(object):
+
+    """
+    A number of worker processes, each running a share of the games.
+    Each worker logs the events of its games to its own file, given a
+    'log_path' with a %d for the number of the worker.
+    """
+
+    def __init__(self, size, log_path=None):
+        self.size = size
+        self._conns = []
+        self._games = {}    # game id -> RemoteGame
+        # per worker, request id -> (callback for the result, AsyncResult or None)
+        self._pending = []
+        self._requests = count()
+        self.log = GameLog()
+        for shard in range(size):
+            conn, worker_conn = Pipe()
+            worker = Process(target=run_worker,
+                             args=(worker_conn, log_path and log_path % shard))
+            worker.daemon = True
+            worker.start()
+            self._conns.append(conn)
+            self._pending.append({})
+            gevent.spawn(self._receive, shard)
+
+    def shard(self, game_id):
+        "The index of the worker that a game belongs to."
+        return (zlib.crc32(str(game_id)) & 0xffffffff) % self.size
+
+    def create_game(self, game_id, data, **kwargs):
+        "Create a game on its worker, and return a RemoteGame for it."
+        game = self._games[game_id] = RemoteGame(self, game_id)
+        self.send(game_id, "create", data, kwargs)
+        return game
+
+    def send(self, game_id, command, *args):
+        "Send a command to a game, without waiting for a result."
+        self._conns[self.shard(game_id)].send((command, game_id, None) + args)
+
+    def request(self, game_id, command, *args, **kwargs):
+        """
+        Send a command to a game. The result is passed to the given
+        'callback' when it arrives, or else returned when it does. If the
+        command fails, the callback gets None, or else a ShardError is
+        raised.
+        """
+        callback = kwargs.get("callback")
+        result = None
+        if callback is None:
+            result = AsyncResult()
+            callback = result.set
+        shard = self.shard(game_id)
+        request_id = next(self._requests)
+        pending = self._pending[shard]
+        pending[request_id] = (callback, result)
+        try:
+            self._conns[shard].send((command, game_id, request_id) + args)
+        except IOError as e:  # the worker is gone
+            self._fail(pending.pop(request_id), str(e))
+        return result and result.get()
+
+    def _fail(self, request, error):
+        "Let whoever made a request know that it failed."
+        callback, result = request
+        if result is None:
+            callback(None)
+        else:
+            result.set_exception(ShardError(error))
+
+    def _receive(self, shard):
+        "Handle whatever comes back from a worker, until it's gone."
+        conn, pending = self._conns[shard], self._pending[shard]
+        while True:
+            wait_read(conn.fileno())
+            try:
+                kind, key, value = conn.recv()
+            except EOFError:
+                break
+            if kind == "frame":
+                game = self._games.get(key)
+                if game:
+                    game.broadcast(value)
+            elif kind == "result":
+                pending.pop(key)[0](value)
+            elif kind == "error":
+                self._fail(pending.pop(key), value)
+            elif kind == "failed":
+                game = self._games.get(key)
+                if game:
+                    game.failed()
+        self.log.log(ERROR, "shard", "worker %d is gone", shard)
+        for request_id in list(pending):
+            self._fail(pending.pop(request_id), "worker %d is gone" % shard)
+
+
+class RemoteGame(object):
+
+    "Stands in for a game that's running in a worker process."
+
+    def __init__(self, pool, _id):
+        self.pool = pool
+        self._id = _id
+        self.queues = set()
+        self._joining = 0  # listeners waiting for the worker to subscribe them
+        self.listener_options = {}
+        self.log = GameLog(_id)  # the game itself logs in the worker, see run_worker
+
+    def broadcast(self, frame):
+        "Pass on an event frame from the worker to all listeners"
+        for queue in self.queues:
+            queue.put(frame)
+
+    def listen(self, last_event_id=None, hero=None, format="json"):
+        """
+        Add a listener (client). Following a hero, and the compact format,
+        are not supported for remote games yet, so the listener gets
+        everything, as JSON.
+        """
+        queue = Listener(**self.listener_options)
+        left = []  # not empty once the listener is gone
+
+        def subscribed(frames):
+            # runs in the receiving greenlet, so no frames can come between
+            self._joining -= 1
+            if left:
+                self._unlisten()
+            elif frames is None:
+                self.log.warning("listener", "could not listen to the game")
+                queue.drop()
+            else:
+                for frame in frames:
+                    queue.put(frame)
+                self.queues.add(queue)
+
+        # counted as listening from now on, so that the worker isn't told to
+        # stop sending frames while it's being asked for them
+        self._joining += 1
+        self.pool.request(self._id, "listen", last_event_id, callback=subscribed)
+        try:
+            while True:
+                frame = queue.get()
+                if frame is None:
+                    self.log.warning("listener", "dropped a listener that fell behind")
+                    break
+                yield frame
+        except GeneratorExit:
+            self.log.info("listener", "a listener left")
+        finally:
+            left.append(True)
+            self.queues.discard(queue)
+            self._unlisten()
+
+    def failed(self):
+        "The game has stopped after an error in the worker. Let the listeners go."
+        self.log.warning("tick", "the game failed in the worker")
+        for queue in self.queues:
+            queue.drop()
+        self.queues.clear()
+
+    def _unlisten(self):
+        "Tell the worker to stop sending frames, if nobody is listening any more."
+        if not self.queues and not self._joining:
+            self.pool.send(self._id, "unlisten")
+
+    def toggle_door(self, door_id, callback=None):
+        return self.pool.request(self._id, "toggle_door", door_id, callback=callback)
+
+    def move_entity(self, entity_id, room_id, callback=None):
+        return self.pool.request(self._id, "move_entity", entity_id, room_id,
+                                 callback=callback)
+
+
+class PipeQueue(object):
+
+    "Takes the place of the listener queues of a game in a worker process."
+
+    def __init__(self, conn, game_id):
+        self.conn = conn
+        self.game_id = game_id
+
+    def put(self, frame):
+        self.conn.send(("frame", self.game_id, frame))
+
+
+DEFERRED = object()  # a command result that's sent later, when it's ready
+
+
+def run_worker(conn, log_path=None, log_interval=0.5):
+    """
+    The main loop of a worker process. The events of its games are logged
+    to 'log_path', if given, as the server's event log is another process's.
+    The loop writes them out itself, every 'log_interval' seconds: with
+    gevent monkey patching, a writer thread would be a greenlet, and never
+    get to run while the loop waits on the pipe.
+    """
+    next_flush = None
+    if log_path:
+        eventlog.log.open(log_path, interval=None)
+        next_flush = time.time() + log_interval
+    games = {}
+    scheduler = GameScheduler(autostart=False,
+                              failed=lambda game: drop_game(conn, games, game))
+    while True:
+        deadlines = [d for d in (scheduler.next_deadline(), next_flush) if d is not None]
+        timeout = max(0, min(deadlines) - time.time()) if deadlines else None
+        if conn.poll(timeout):
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # the server is gone
+            command, game_id, request_id = message[:3]
+            reply = lambda result, request_id=request_id: (
+                request_id is not None and conn.send(("result", request_id, result)))
+            try:
+                result = handle_command(conn, scheduler, games, command, game_id,
+                                        *message[3:], reply=reply)
+            except KeyError:  # no such game, door, entity...
+                result = None
+            except Exception as e:  # bad arguments, unknown command...
+                GameLog(game_id).log(ERROR, "command", "%s failed: %s", command,
+                                     traceback.format_exc())
+                if request_id is not None:
+                    conn.send(("error", request_id, "%s failed: %s" % (command, e)))
+                result = DEFERRED  # already answered
+            if result is not DEFERRED:
+                reply(result)
+        scheduler.run_due()
+        if next_flush is not None and time.time() >= next_flush:
+            eventlog.log.flush()
+            next_flush = time.time() + log_interval
+    eventlog.log.close()  # writing out what's left
+
+
+def drop_game(conn, games, game):
+    """
+    Give up on a game whose tick failed, in a worker process: the commands
+    waiting for its next tick get None, and the server is told.
+    """
+    games.pop(game._id, None)
+    commands, dropped = game.commands.drain()
+    for _, _, callbacks in commands + dropped:
+        for callback in callbacks:
+            callback(None)
+    conn.send(("failed", game._id, None))
+
+
+def handle_command(conn, scheduler, games, command, game_id, *args, **kwargs):
+    """
+    Carry out a command from the server, in a worker process. Player
+    commands wait for the game's next tick, and pass their result to
+    'reply' then.
+    """
+    if command == "create":
+        data, kwargs = args
+        games[game_id] = Game(game_id, data, scheduler=scheduler, **kwargs)
+        return
+    game = games[game_id]
+    if command == "listen":
+        if not game.queues:
+            game.queues.add(PipeQueue(conn, game_id))
+        if not game.is_running:
+            game.run()
+        return game.resume(*args)
+    if command == "unlisten":
+        game.queues.clear()  # the game stops at its next tick
+        return
+    if command == "toggle_door":
+        game.toggle_door(*args, callback=kwargs["reply"])
+        return DEFERRED
+    if command == "move_entity":
+        game.move_entity(*args, callback=kwargs["reply"])
+        return DEFERRED
+    raise ValueError("Unknown command %r" % command)
@@ -1 +1 @@
-from state import StateMachine
+from state import StateMachine, StateGraph
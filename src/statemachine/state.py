@@ -50,6 +50,17 @@ The StateMachine can be given functions to run on each state
 transition and upon reaching an end state. States and Exits can
 also have actions attached.
 
+When there are lots of machines working the same way, the states can
+instead be defined once, as a StateGraph shared by all the instances of
+a StateMachine subclass. Its conditions and actions are then called with
+the machine as argument, so they can be plain (unbound) methods:
+
+> class Door(StateMachine):
+>     def is_pushed(self):
+>         return self.pushed
+>     graph = StateGraph("CLOSED", "OPEN")
+>     graph.CLOSED.when(is_pushed).goto(graph.OPEN)
+
 """
 
 from collections import OrderedDict
@@ -64,12 +75,21 @@ def state_name(state):
     return state.name if isinstance(state, State) else state
 
 
+def bind_args(action, args, kwargs):
+    "Attach arguments to an action, after the machine (if it's given one)."
+    if not args and not kwargs:
+        return action
+    return action and (lambda *machine: action(*(machine + args), **kwargs))
+
+
 class Exit(object):
 
+    __slots__ = ("cond", "dest", "action")
+
     def __init__(self, dest=None, cond=None, action=None, *args, **kwargs):
         self.cond = cond
         self.dest = state_name(dest)
-        self.action = action and (lambda: action(*args, **kwargs))
+        self.action = bind_args(action, args, kwargs)
 
     def when(self, cond):
         self.cond = cond
@@ -86,10 +106,13 @@ class Exit(object):
 
 class State(object):
 
+    __slots__ = ("name", "exits", "action", "recurring_action")
+
     def __init__(self, name, exits=None, action=None, *args, **kwargs):
         self.name = name
         self.exits = exits or []
-        self.action = action and (lambda: action(*args, **kwargs))
+        self.action = bind_args(action, args, kwargs)
+        self.recurring_action = None
 
     def when(self, cond):
         ex = Exit(cond=cond)
@@ -107,27 +130,62 @@ class State(object):
         return self
 
     def set_action(self, action, *args, **kwargs):
-        self.action = action and (lambda: action(*args, **kwargs))
+        self.action = bind_args(action, args, kwargs)
         return self
 
 
+def make_states(states):
+    "An ordered dict of States, from States or names."
+    if not states:
+        raise ValueError("A StateMachine needs at least one State")
+    states = [s if isinstance(s, State) else State(s) for s in states]
+    return OrderedDict((state.name, state) for state in states)
+
+
+class StateGraph(object):
+
+    """
+    States and exits defined once, for sharing between all the instances
+    of a StateMachine subclass (as its 'graph'). Conditions and actions
+    are called with the machine as their argument.
+    """
+
+    __slots__ = ("states",)
+
+    def __init__(self, *states):
+        self.states = make_states(states)
+
+    def __getitem__(self, state):
+        return self.states[state]
+
+    def __getattr__(self, state):
+        try:
+            return self.states[state]
+        except KeyError:
+            raise AttributeError(state)
+
+
 class StateMachine(object):
 
+    __slots__ = ("_states", "_state", "_shared", "start",
+                 "on_state_change", "on_end_state", "history")
+
+    graph = None  # a StateGraph shared by all instances, instead of 'states'
+    keep_history = True  # whether to remember when each state was reached
+    clock = time  # where the time for the history comes from, anything with time()
+
     def __init__(self, states=None, start=None,
                  on_state_change=None, on_end_state=None):
-        if not states:
-            raise ValueError("A StateMachine needs at least one State")
-        states = [s if isinstance(s, State) else State(s)
-                  for s in states]
-        self._states = OrderedDict((state.name, state)
-                                   for state in states)
-        self.start = start or states[0].name
+        self._shared = states is None and self.graph is not None
+        self._states = self.graph.states if self._shared else make_states(states)
+        self.start = start or next(iter(self._states))
         self._state = self._states[self.start]
 
         self.on_state_change = on_state_change
         self.on_end_state = on_end_state
 
-        self.history = OrderedDict([(self.start, time.time())])
+        self.history = (OrderedDict([(self.start, self.clock.time())])
+                        if self.keep_history else None)
 
     def __getitem__(self, state):
         if state in self._states:
@@ -136,8 +194,18 @@ class StateMachine(object):
             raise AttributeError(state)
 
     def __getattr__(self, state):
+        if state.startswith("_"):  # e.g. a slot that's not set yet
+            raise AttributeError(state)
         return self[state]
 
+    def _call(self, fun):
+        "Call a condition or action, giving it the machine if it's shared."
+        return fun and (fun(self) if self._shared else fun())
+
+    def state_changed(self, old, new):
+        "Called on each state change. Subclasses may do more here."
+        maybe(self.on_state_change, old, new)
+
     def __iter__(self):
         return self
 
@@ -151,12 +219,13 @@ class StateMachine(object):
     @state.setter
     def state(self, new_state):
         if new_state != self.state:
-            maybe(self.on_state_change, self.state, new_state)
+            self.state_changed(self.state, new_state)
             self._state = self[new_state]
-            maybe(self._state.action)
-            self.history[self.state] = time.time()
+            self._call(self._state.action)
+            if self.history is not None:
+                self.history[self.state] = self.clock.time()
         else:
-            maybe(self._state.recurring_action)
+            self._call(self._state.recurring_action)
 
     @property
     def finished(self):
@@ -167,8 +236,8 @@ class StateMachine(object):
         if not self._state.exits:  # end state
             maybe(self.on_end_state)
         for ex in self._state.exits:
-            if not ex.cond or ex.cond():
-                maybe(ex.action)
+            if not ex.cond or self._call(ex.cond):
+                self._call(ex.action)
                 self.state = ex.dest
                 return self.state
         raise StopIteration
@@ -3,7 +3,7 @@ from collections import OrderedDict
 from unittest import TestCase
 from mock import Mock
 
-from state import StateMachine, State
+from state import StateMachine, StateGraph, State
 
 
 class StateMachineTestCase(TestCase):
@@ -113,3 +113,38 @@ class StateMachineTestCase(TestCase):
         self.assertEquals(sm.state, "C")
         action.assert_called_with()
         state_action.assert_called_with()
+
+
+class Door(StateMachine):
+
+    def __init__(self):
+        self.pushed = False
+        self.slams = 0
+        StateMachine.__init__(self)
+
+    def is_pushed(self):
+        return self.pushed
+
+    def slam(self):
+        self.slams += 1
+
+    graph = StateGraph("CLOSED", "OPEN")
+    graph.CLOSED.when(is_pushed).goto(graph.OPEN)
+    graph.OPEN.when(lambda door: not door.pushed).do(slam).goto(graph.CLOSED)
+
+
+class StateGraphTestCase(TestCase):
+
+    def test_graph_is_shared(self):
+        a, b = Door(), Door()
+        self.assertIs(a.OPEN, b.OPEN)
+
+    def test_conditions_and_actions_get_the_machine(self):
+        a, b = Door(), Door()
+        a.pushed = True
+        a.proceed()
+        b.proceed()
+        self.assertEqual((a.state, b.state), ("OPEN", "CLOSED"))
+        a.pushed = False
+        a.proceed()
+        self.assertEqual((a.state, a.slams, b.slams), ("CLOSED", 1, 0))
@@ -0,0 +1,44 @@
+// Sending commands to the game over a WebSocket (see channel.py).
+// Commands given in the same go are sent together, as one batch, and
+// each callback gets the result of its own command.
+
+function Channel(url) {
+    this.url = url;
+    this.nextId = 0;
+    this.callbacks = {};  // command id -> callback
+    this.batch = [];
+    this.socket = new WebSocket(url);
+    this.socket.addEventListener("message", this.receive.bind(this));
+}
+
+Channel.prototype.isOpen = function () {
+    return this.socket.readyState == WebSocket.OPEN;
+};
+
+Channel.prototype.send = function (command, args, callback) {
+    var id = this.nextId++;
+    this.callbacks[id] = callback;
+    this.batch.push({id: id, command: command, args: args});
+    if (this.batch.length == 1)
+        setTimeout(this.flush.bind(this), 0);  // after whatever else comes now
+};
+
+Channel.prototype.flush = function () {
+    this.socket.send(JSON.stringify(this.batch));
+    this.batch = [];
+};
+
+Channel.prototype.receive = function (event) {
+    var data = event.data.charAt(0) == "{" ? JSON.parse(event.data) : null;
+    if (!data || !data.results) {  // game events, if they come this way
+        if (this.onevent)
+            this.onevent(event);
+        return;
+    }
+    data.results.forEach(function (response) {
+        var callback = this.callbacks[response.id];
+        delete this.callbacks[response.id];
+        if (callback)
+            callback(response.result, response.error);
+    }, this);
+};
@@ -0,0 +1,93 @@
+// Decoding the compact event format (see wire.py) into JSON patches,
+// so that the rest of the client doesn't need to know about it.
+
+var Compact = (function () {
+
+    var OPS = ["add", "replace", "remove"],
+        KINDS = ["rooms", "connections", "entities"],
+        FIELDS = ["health", "room", "path", "state", "opened", "locked", "items"],
+        WHOLE = 255,
+        STATES = ["IDLE", "MOVING", "FIGHTING", "DEAD"];
+
+    function Decoder(ids) {
+        this.ids = {};
+        KINDS.forEach(function (kind) {this.ids[kind] = ids[kind].slice();}, this);
+    }
+
+    // Turn the base64 data of a frame into a list of patch operations
+    Decoder.prototype.decode = function (data) {
+        var raw = atob(data), bytes = new Uint8Array(raw.length);
+        for (var i = 0; i < raw.length; i++)
+            bytes[i] = raw.charCodeAt(i);
+        this.bytes = bytes;
+        this.view = new DataView(bytes.buffer);
+        this.pos = 0;
+        var ops = [];
+        while (this.pos < bytes.length)
+            ops.push(this.op());
+        return ops;
+    };
+
+    Decoder.prototype.varint = function () {
+        var n = 0, shift = 0, b;
+        do {
+            b = this.bytes[this.pos++];
+            n += (b & 0x7f) * Math.pow(2, shift);
+            shift += 7;
+        } while (b >= 0x80);
+        return n;
+    };
+
+    Decoder.prototype.float = function () {
+        var f = this.view.getFloat32(this.pos, true);
+        this.pos += 4;
+        return f;
+    };
+
+    Decoder.prototype.op = function () {
+        var header = this.bytes[this.pos++],
+            op = OPS[header >> 2], kind = KINDS[header & 3],
+            number = this.varint(),
+            field = this.bytes[this.pos++],
+            value;
+        if (op != "remove")
+            value = this.value(field);
+        var ids = this.ids[kind];
+        if (number == ids.length)  // a newcomer
+            ids.push(value._id);
+        var result = {op: op, path: "/" + kind + "/" + ids[number]};
+        if (field != WHOLE)
+            result.path += "/" + FIELDS[field & 0x7f];
+        if (op != "remove")
+            result.value = value;
+        return result;
+    };
+
+    Decoder.prototype.value = function (field) {
+        switch (field) {
+        case 0:
+            return this.float();
+        case 1:
+            return this.ids.rooms[this.varint()];
+        case 2:
+            var path = [], count = this.varint();
+            for (var i = 0; i < count; i++) {
+                var room = this.ids.rooms[this.varint()],
+                    conn = this.ids.connections[this.varint()];
+                path.push([room, conn, this.float()]);
+            }
+            return path;
+        case 3:
+            return STATES[this.bytes[this.pos++]];
+        case 4:
+        case 5:
+            return !!this.bytes[this.pos++];
+        }
+        var length = this.varint(),
+            blob = String.fromCharCode.apply(null, this.bytes.subarray(this.pos, this.pos + length));
+        this.pos += length;
+        return JSON.parse(blob);  // ASCII, since python escapes the rest
+    };
+
+    return {Decoder: Decoder};
+})();
@@ -17,9 +17,15 @@ window.addEventListener("load", function () {
         function update (event) {
             if (!event.data)
                 return;
-            var data = JSON.parse(event.data);  // decode JSON
+            var data;
+            if (this.decoder && event.data.charAt(0) != "{")
+                data = {patch: this.decoder.decode(event.data)};  // compact patch
+            else
+                data = JSON.parse(event.data);  // decode JSON
             console.log(data);
             if ("data" in data) {
+                if (data.ids)  // the compact format, see compact.js
+                    this.decoder = new Compact.Decoder(data.ids);
                 // We got a full level data object, let's initialize
                 this.connections = data.data.connections;
                 this.rooms = data.data.rooms;
@@ -50,10 +56,29 @@ window.addEventListener("load", function () {
         this.game_id = parseInt(document.getElementById("game-id").textContent);
 
         // Subscribe to server events (SSE) for the game
-        this.sse_stream = new EventSource("/listen_game/" + this.game_id);
+        // (add "?format=compact" to the page URL for the compact format)
+        var format = /format=(\w+)/.exec(window.location.search);
+        this.sse_stream = new EventSource("/listen_game/" + this.game_id +
+                                          (format ? "?format=" + format[1] : ""));
         this.sse_stream.addEventListener("message", update.bind(this));
+
+        // Commands go over a WebSocket when possible, see channel.js
+        if (window.WebSocket)
+            this.channel = new Channel("ws://" + window.location.host + "/" +
+                                       this.game_id + "/socket");
     }
 
+    // Send a command to the game, falling back to a plain request ('url')
+    World.prototype.command = function (command, args, url) {
+        var success = function (data) {
+            console.log(data);
+        };
+        if (this.channel && this.channel.isOpen())
+            this.channel.send(command, args, success);
+        else
+            d3.json(url, success);
+    };
+
     // start the world
     World.prototype.start = function () {
         console.log("start");
@@ -131,10 +156,8 @@ window.addEventListener("load", function () {
                             var room = d3.event.target.id;
                             console.log("click", room);
                             //this.getHero().updatePath(room);
-                            var success = function (data) {
-                                console.log(data);
-                            };
-                            d3.json(this.game_id + "/entity/hero/move/" + room, success);
+                            this.command("move_entity", ["hero", room],
+                                         this.game_id + "/entity/hero/move/" + room);
                         }
                     }.bind(this), true);
         }, this);
@@ -150,10 +173,8 @@ window.addEventListener("load", function () {
                         .on("click", function () {
                             if (!world.preventClick) {
                                 console.log("clicked door", conn);
-                                var success = function (data) {
-                                    console.log(data);
-                                };
-                                d3.json(this.game_id + "/door/" + conn + "/toggle", success);
+                                this.command("toggle_door", [conn],
+                                             this.game_id + "/door/" + conn + "/toggle");
                             }
                         }.bind(this), true);
             }
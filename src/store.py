@@ -0,0 +1,163 @@
+"""
+An optional, array backed store for the fighting stats of entities.
+
+With lots of entities, fighting one attack at a time (see Entity.fight)
+is slow. A level can instead keep the stats of its entities in NumPy
+arrays, one row per entity, and resolve all the fights in every room at
+once, each tick:
+
+ - every entity that's fighting, and whose cooldown is over, attacks
+ - the enemy is picked at random among those in the same room
+ - it's hit with the attacker's chance to hit, and damages add up
+
+The entities are then only views of their rows, for the stats kept here
+(see Column). Everything else about them stays the same.
+
+> level = Level.from_dict(data, store=True)
+
+Requires NumPy. Without it, levels fight the old way.
+"""
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+
+HERO, MONSTER = 0, 1  # the sides
+
+
+class Column(object):
+
+    """
+    An entity attribute that lives in the level's EntityStore, if there is
+    one, and in the entity itself ("_" + name) otherwise. If 'record' is
+    set, changes are noted in the journal.
+    """
+
+    def __init__(self, name, record=False):
+        self.name = name
+        self.attr = "_" + name
+        self.record = record
+
+    def __get__(self, entity, cls):
+        if entity is None:
+            return self
+        store = entity._store
+        if store is None:
+            return getattr(entity, self.attr)
+        return float(store.columns[self.name][entity._slot])
+
+    def __set__(self, entity, value):
+        store = entity._store
+        if store is None:
+            setattr(entity, self.attr, value)
+        else:
+            store.columns[self.name][entity._slot] = value
+        if self.record:
+            entity._record(self.name, value)
+
+
+class EntityStore(object):
+
+    "The stats of the entities of one level, as arrays. Rows are reused."
+
+    COLUMNS = ("health", "speed", "chance_to_hit", "weapon_damage",
+               "fight_cooldown", "fight_timeout")
+
+    def __init__(self, rooms, capacity=64, seed=None):
+        if numpy is None:
+            raise RuntimeError("The entity store needs NumPy")
+        self.room_numbers = dict((_id, i) for i, _id in enumerate(sorted(rooms)))
+        self.random = numpy.random.RandomState(seed)
+        self.entities = []  # row -> entity (or None)
+        self._free = []     # rows to reuse
+        self.columns = dict((name, numpy.zeros(capacity)) for name in self.COLUMNS)
+        self.room = numpy.full(capacity, -1, dtype=numpy.int64)
+        self.side = numpy.zeros(capacity, dtype=numpy.int64)
+        self.fighting = numpy.zeros(capacity, dtype=bool)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self.entities) - len(self._free)
+
+    def _grow(self):
+        "Make room for twice as many entities."
+        capacity = 2 * len(self.room)
+        for name, column in self.columns.items():
+            self.columns[name] = numpy.resize(column, capacity)
+        self.room = numpy.concatenate([self.room, numpy.full(len(self.room), -1, self.room.dtype)])
+        for name in ("side", "fighting", "alive"):
+            column = getattr(self, name)
+            setattr(self, name, numpy.concatenate([column, numpy.zeros_like(column)]))
+
+    def add(self, entity, side):
+        "Move an entity's stats into the store."
+        if self._free:
+            row = self._free.pop()
+            self.entities[row] = entity
+        else:
+            row = len(self.entities)
+            if row == len(self.room):
+                self._grow()
+            self.entities.append(entity)
+        for name in self.COLUMNS:
+            self.columns[name][row] = getattr(entity, "_" + name)
+        self.room[row] = self.room_numbers[entity.room._id] if entity.room else -1
+        self.side[row] = side
+        self.fighting[row] = entity.state == "FIGHTING"
+        self.alive[row] = True
+        entity._store, entity._slot = self, row
+
+    def remove(self, entity):
+        "Give an entity its stats back, and free its row."
+        row = entity._slot
+        for name in self.COLUMNS:
+            setattr(entity, "_" + name, float(self.columns[name][row]))
+        entity._store = entity._slot = None
+        self.entities[row] = None
+        self.alive[row] = self.fighting[row] = False
+        self.room[row] = -1
+        self._free.append(row)
+
+    def move(self, entity):
+        "Keep track of the room an entity is in."
+        self.room[entity._slot] = self.room_numbers[entity.room._id]
+
+    def set_fighting(self, entity, fighting):
+        self.fighting[entity._slot] = fighting
+
+    def fight(self, now):
+        """
+        Resolve the attacks of all the fighting entities whose cooldown is
+        over at time 'now'. Returns the entities that took damage.
+        """
+        n = len(self.entities)
+        rooms = len(self.room_numbers)
+        health = self.columns["health"]
+        present = numpy.flatnonzero(self.alive[:n] & (self.room[:n] >= 0))
+
+        # who's where: rows grouped by side and room
+        group = self.side[present] * rooms + self.room[present]
+        occupants = present[numpy.argsort(group, kind="mergesort")]
+        counts = numpy.bincount(group, minlength=2 * rooms)
+        starts = numpy.cumsum(counts) - counts
+
+        ready = self.fighting[:n] & (self.columns["fight_timeout"][:n] <= now)
+        attackers = present[ready[present]]
+        enemies = (1 - self.side[attackers]) * rooms + self.room[attackers]
+        available = counts[enemies]
+        attackers, enemies, available = (attackers[available > 0], enemies[available > 0],
+                                         available[available > 0])
+        if not len(attackers):
+            return []
+        picks = (self.random.random_sample(len(attackers)) * available).astype(numpy.int64)
+        targets = occupants[starts[enemies] + picks]
+        self.columns["fight_timeout"][attackers] = now + self.columns["fight_cooldown"][attackers]
+
+        hits = self.random.random_sample(len(attackers)) < self.columns["chance_to_hit"][attackers]
+        targets = targets[hits]
+        numpy.subtract.at(health, targets, self.columns["weapon_damage"][attackers[hits]])
+        damaged = numpy.unique(targets)
+        health[damaged] = numpy.maximum(health[damaged], 0)
+        return [self.entities[row] for row in damaged]
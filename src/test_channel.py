@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from gevent.queue import Queue
+from mock import Mock
+
+from channel import Channel, run_commands
+
+
+class FakeSocket(object):
+
+    def __init__(self, *messages):
+        self.incoming = Queue()
+        for message in messages:
+            self.incoming.put(message)
+        self.sent = []
+
+    def receive(self):
+        return self.incoming.get()
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def returning(result):
+    "A game method that calls back at once, with the result."
+    return lambda *args, **kwargs: kwargs["callback"](result)
+
+
+class RunCommandsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Mock(spec=["toggle_door", "move_entity"])
+
+    def test_results_are_correlated_by_id(self):
+        self.game.toggle_door.side_effect = returning(True)
+        self.game.move_entity.side_effect = returning([("B", "1", 1.0)])
+        response = run_commands(self.game, [
+            {"id": 7, "command": "toggle_door", "args": ["1"]},
+            {"id": "x", "command": "move_entity", "args": ["hero", "B"]}])
+        self.assertEqual(response["results"], [{"id": 7, "result": True},
+                                               {"id": "x", "result": [("B", "1", 1.0)]}])
+        self.assertEqual(self.game.toggle_door.call_args[0], ("1",))
+        self.assertEqual(self.game.move_entity.call_args[0], ("hero", "B"))
+
+    def test_errors(self):
+        self.game.toggle_door.side_effect = KeyError("door")
+        self.game.move_entity.side_effect = TypeError
+        results = run_commands(self.game, [
+            {"id": 1, "command": "toggle_door", "args": ["door"]},
+            {"id": 2, "command": "explode"},
+            {"id": 3, "command": "move_entity", "args": []}])["results"]
+        self.assertEqual([sorted(r) for r in results], [["error", "id"]] * 3)
+
+    def test_malformed_commands(self):
+        results = run_commands(self.game, [
+            1, "x", {"id": 1, "command": []}, {"id": 2, "command": "toggle_door", "args": "1"}
+        ])["results"]
+        self.assertEqual([r["id"] for r in results], [None, None, 1, 2])
+        self.assertEqual([sorted(r) for r in results], [["error", "id"]] * 4)
+        self.assertFalse(self.game.toggle_door.called)
+
+
+class ChannelTestCase(unittest.TestCase):
+
+    def test_serve_until_closed(self):
+        game = Mock(spec=["toggle_door"])
+        game.toggle_door.side_effect = returning(False)
+        socket = FakeSocket('{"id": 1, "command": "toggle_door", "args": ["1"]}',
+                            'nonsense', None)
+        Channel(game, socket).serve()
+        self.assertEqual(json.loads(socket.sent[0]),
+                         {"results": [{"id": 1, "result": False}]})
+        self.assertIn("error", json.loads(socket.sent[1]))
+
+    def test_malformed_batches(self):
+        socket = FakeSocket('5', '"x"', '[1]', None)
+        Channel(Mock(spec=[]), socket).serve()
+        self.assertEqual([json.loads(message) for message in socket.sent], [
+            {"error": "Not a list of commands"},
+            {"error": "Not a list of commands"},
+            {"results": [{"id": None, "error": "Not a command: 1"}]}])
+
+    def test_push_events(self):
+        game = Mock(spec=["listen"])
+        game.listen.return_value = iter(['id: 1\ndata: {"data": {}}\n\n'])
+        socket = FakeSocket()
+        channel = Channel(game, socket)
+        channel.push_events(format="compact")
+        channel._events.join()
+        game.listen.assert_called_once_with(format="compact")
+        self.assertEqual(socket.sent, ['{"data": {}}'])
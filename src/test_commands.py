@@ -0,0 +1,38 @@
+import unittest
+
+from commands import CommandQueue
+
+
+class CommandQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = CommandQueue(cancelling=["toggle"], superseding=["move"])
+
+    def test_commands_come_out_in_order(self):
+        self.queue.put("toggle", ["a"], 1)
+        self.queue.put("move", ["x", "A"], 2)
+        self.queue.put("other", [], None)
+        commands, dropped = self.queue.drain()
+        self.assertEqual(commands, [("toggle", ("a",), [1]),
+                                    ("move", ("x", "A"), [2]),
+                                    ("other", (), [])])
+        self.assertEqual(dropped, [])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_cancelling_commands(self):
+        for i in range(5):
+            self.queue.put("toggle", ["a"], i)
+        self.queue.put("toggle", ["b"], 5)
+        commands, dropped = self.queue.drain()
+        self.assertEqual(commands, [("toggle", ("a",), [4]), ("toggle", ("b",), [5])])
+        self.assertEqual(dropped, [("toggle", ("a",), [0, 1]), ("toggle", ("a",), [2, 3])])
+
+    def test_superseding_commands(self):
+        self.queue.put("move", ["x", "A"], 1)
+        self.queue.put("toggle", ["a"], 2)
+        self.queue.put("move", ["y", "A"], 3)
+        self.queue.put("move", ["x", "B"], 4)
+        commands, dropped = self.queue.drain()
+        self.assertEqual(commands, [("toggle", ("a",), [2]), ("move", ("y", "A"), [3]),
+                                    ("move", ("x", "B"), [4])])
+        self.assertEqual(dropped, [("move", ("x", "A"), [1])])
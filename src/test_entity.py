@@ -1,4 +1,6 @@
 from mock import Mock, patch
+import random
+import time
 import unittest
 
 from entity import Hero, Monster
@@ -8,7 +10,10 @@ class HeroTestCase(unittest.TestCase):
 
     def setUp(self):
         self.level = Mock()
+        self.level.clock, self.level.random = time, random  # patched below
         self.level.get_entities.return_value = []
+        self.level.get_heroes.return_value = []
+        self.level.get_monsters.return_value = []
         self.level.get_connected_rooms.return_value = []
         self.room = Mock()
         self.enemy = Mock()
@@ -17,6 +22,11 @@ class HeroTestCase(unittest.TestCase):
                          speed=5.0, chance_to_hit=0.5, weapon_damage=3, healing=1,
                          max_health=100, health=100, ammo=10, morale=7)
 
+    def test_heroes_share_their_state_graph(self):
+        other = Hero("other", self.level, self.room)
+        self.assertIs(self.hero.MOVING, other.MOVING)
+        self.assertFalse(hasattr(self.hero, "__dict__"))
+
     def test_hero_idle_if_nothing_to_do(self):
         self.hero.proceed()
         self.assertEqual(self.hero.state, "IDLE")
@@ -24,12 +34,19 @@ class HeroTestCase(unittest.TestCase):
     def test_hero_moves_if_has_path(self):
         with patch("time.time") as mock_time:
             mock_time.return_value = 0.  # set the time seen by the hero
-            destination = Mock()
+            destination = (Mock(), Mock(), 1)
             self.hero._path.append(destination)
             self.hero.proceed()
             self.assertEqual(self.hero.state, "MOVING")
             self.assertEqual(self.hero._timeout, 100.0 / self.hero.speed)
 
+    def test_hero_move_time_depends_on_distance(self):
+        with patch("time.time") as mock_time:
+            mock_time.return_value = 0.
+            self.hero._path.append((Mock(), Mock(), 2.5))
+            self.hero.proceed()
+            self.assertEqual(self.hero._timeout, 2.5 * 100.0 / self.hero.speed)
+
     def test_hero_enters_next_room_if_has_path(self):
         with patch("time.time") as mock_time:
             mock_time.return_value = 0.  # set the time seen by the hero
@@ -48,7 +65,7 @@ class HeroTestCase(unittest.TestCase):
                           health=MONSTER_HEALTH)
         with patch("random.random") as mock_random:
             mock_random.return_value = 0.1  # < chance_to_hit => always hit!
-            self.level.get_entities.return_value = [monster]
+            self.level.get_monsters.return_value = [monster]
             self.hero.update()
             self.assertEqual(self.hero.state, "FIGHTING")
             self.assertEqual(monster.health, MONSTER_HEALTH - self.hero.weapon_damage)
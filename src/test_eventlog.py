@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from eventlog import EventLog, GameLog, DEBUG, INFO, WARNING
+
+
+class Formatted(object):
+
+    "Counts how many times it's been formatted."
+
+    count = 0
+
+    def __repr__(self):
+        Formatted.count += 1
+        return "formatted"
+
+
+class EventLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "events.log")
+        self.log = EventLog(capacity=3, clock=lambda: 1.5)
+        self.game_log = GameLog("game", self.log)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+
+    def read(self, path=None):
+        with open(path or self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_disabled_levels_are_not_kept_or_formatted(self):
+        Formatted.count = 0
+        self.game_log.debug("state", "%r", Formatted())
+        self.assertEqual(len(self.log.records), 0)
+        self.log.level = DEBUG
+        self.game_log.debug("state", "%r", Formatted())
+        self.assertEqual(len(self.log.records), 1)
+        self.assertEqual(Formatted.count, 0)  # not until written
+
+    def test_records_are_tagged(self):
+        self.game_log.tick = 7
+        self.game_log.warning("damage", "lost %d HP", 5, entity="hero")
+        self.log.open(self.path)
+        self.log.flush()
+        self.assertEqual(self.read(), [dict(time=1.5, level="WARNING", game="game", tick=7,
+                                            entity="hero", event="damage",
+                                            message="lost 5 HP")])
+
+    def test_full_buffer_drops_oldest(self):
+        for i in range(5):
+            self.game_log.info("spawn", "%d", i)
+        self.assertEqual(self.log.dropped, 2)
+        self.assertEqual([record[-1] for record in self.log.take()], [(2,), (3,), (4,)])
+
+    def test_rotation(self):
+        self.log.open(self.path, max_bytes=100, backups=2)
+        for i in range(6):
+            self.log.record(INFO, "spawn", "monster %d", (i,))
+            self.log.flush()
+        self.assertEqual(len(self.read()), 1)
+        self.assertEqual([r["message"] for r in self.read(self.path + ".1")], ["monster 4"])
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
@@ -0,0 +1,213 @@
+import json
+import unittest
+
+from gevent.queue import Queue
+
+from clock import VirtualClock
+from game import Game, SKIP
+from scheduler import GameScheduler
+from wire import CompactDecoder
+
+
+GAME_DATA = {
+    "_id": "level",
+    "rooms": {"A": {}, "B": {}},
+    "connections": {"1": {"door": True, "rooms": ["A", "B"]}},
+    "entities": [{"_id": "hero", "is_hero": True, "room": "A"}]
+}
+
+
+class GameTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game("game", json.loads(json.dumps(GAME_DATA)), epoch=0)
+
+    def test_broadcast_encodes_once_for_all_listeners(self):
+        queues = self.game.queues = set([Queue(), Queue()])
+        self.game.broadcast({"patch": []})
+        frames = [q.get_nowait() for q in queues]
+        self.assertEqual(frames[0], 'id: 1\ndata: {"patch": []}\n\n')
+        self.assertIs(frames[0], frames[1])
+
+    def test_snapshot_is_cached_until_something_changes(self):
+        snapshot = self.game.snapshot()
+        self.assertIs(self.game.snapshot(), snapshot)
+        self.assertIsNone(self.game._loop())
+        self.assertIs(self.game.snapshot(), snapshot)
+        self.game.level.toggle_door("1")
+        self.assertTrue(self.game._loop())
+        self.assertIsNot(self.game.snapshot(), snapshot)
+        self.assertEqual(json.loads(self.game.snapshot().split("data: ")[1])["data"],
+                         self.game.level.to_dict())
+
+    def test_compact_listener_gets_compact_patches(self):
+        self.game.queues.add(Queue())  # a JSON listener, so there's a tick
+        stream = self.game.listen(format="compact")
+        snapshot = json.loads(next(stream).split("data: ")[1])
+        self.assertEqual(snapshot["ids"]["connections"], ["1"])
+        decoder = CompactDecoder(snapshot["ids"])
+        self.game.toggle_door("1", callback=lambda result: None)
+        self.game.broadcast(self.game._loop())
+        frame = next(stream)
+        opened = self.game.level.connections["1"].opened
+        self.assertEqual(decoder.decode(frame.split("data: ")[1].strip()),
+                         [{"op": "replace", "path": "/connections/1/opened", "value": opened}])
+        stream.close()
+        self.assertFalse(self.game.compact_queues)
+
+
+class GameSimulationTestCase(unittest.TestCase):
+
+    "Games on a virtual clock, with a seed."
+
+    def simulate(self, seed):
+        data = json.loads(json.dumps(GAME_DATA))
+        data["entities"].extend({"_id": "monster%d" % i, "is_hero": False, "room": "B"}
+                                for i in range(3))
+        game = Game("game", data, clock=VirtualClock(), seed=seed)
+        game.level.spawn_probability = 0.2
+        game.queues.add(Queue())
+        game.simulate(50)
+        return game
+
+    def test_simulated_time_passes(self):
+        game = self.simulate(1)
+        self.assertEqual(game.level.clock.time(), 50.0)
+        self.assertEqual(game.stats.ticks, 50)
+        self.assertEqual(game._event_id, game.queues.pop().qsize())
+
+    def test_same_seed_same_game(self):
+        self.assertEqual(self.simulate(1).level.to_dict(), self.simulate(1).level.to_dict())
+        self.assertNotEqual(self.simulate(1).level.to_dict(), self.simulate(2).level.to_dict())
+
+
+class GameCommandsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game("game", json.loads(json.dumps(GAME_DATA)),
+                         scheduler=GameScheduler(autostart=False))
+        self.results = []
+
+    def test_commands_wait_for_the_next_tick(self):
+        self.game.run()
+        opened = self.game.level.connections["1"].opened
+        self.game.toggle_door("1", callback=self.results.append)
+        self.game.move_entity("hero", "B", callback=self.results.append)
+        self.assertEqual(self.game.level.connections["1"].opened, opened)
+        self.assertEqual(self.results, [])
+        self.game._update()
+        self.assertNotEqual(self.game.level.connections["1"].opened, opened)
+        self.assertEqual(self.results[0], True)
+
+    def test_commands_that_cancel_out(self):
+        self.game.run()
+        opened = self.game.level.connections["1"].opened
+        self.game.move_entity("hero", "B", callback=self.results.append)
+        self.game.toggle_door("1", callback=self.results.append)
+        self.game.toggle_door("1", callback=self.results.append)
+        self.game.move_entity("hero", "A", callback=self.results.append)
+        self.game._update()
+        self.assertEqual(self.game.level.connections["1"].opened, opened)
+        self.assertEqual(sorted(self.results), [None, True, True, []])  # already in A
+
+    def test_commands_are_checked_right_away(self):
+        self.game.run()
+        self.assertRaises(KeyError, self.game.toggle_door, "2", callback=self.results.append)
+        self.assertRaises(KeyError, self.game.move_entity, "hero", "C")
+        self.assertEqual(len(self.game.commands), 0)
+
+    def test_no_waiting_when_not_running(self):
+        self.assertIs(self.game.toggle_door("1"), True)
+        self.game.run()
+        self.game.toggle_door("1", callback=self.results.append)
+        self.game.stop()
+        self.assertEqual(self.results, [True])
+
+
+class GameResumeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game("game", json.loads(json.dumps(GAME_DATA)),
+                         history=4, keyframe_interval=3, epoch=0)
+        self.game.queues.add(Queue())
+
+    def tick(self, n=1):
+        for _ in range(n):
+            self.game.toggle_door("1")
+            self.game.broadcast(self.game._loop())
+
+    def event_ids(self, frames):
+        return [int(frame.split("\n")[0][4:]) for frame in frames]
+
+    def is_snapshot(self, frame):
+        return '"data": ' in frame
+
+    def test_new_listener_gets_snapshot(self):
+        self.tick(2)
+        frames = self.game.resume()
+        self.assertEqual(len(frames), 1)
+        self.assertTrue(self.is_snapshot(frames[0]))
+        self.assertEqual(self.event_ids(frames), [2])
+
+    def test_resume_gets_missed_events(self):
+        self.tick(5)
+        frames = self.game.resume(2)
+        self.assertEqual(self.event_ids(frames), [3, 4, 5])
+        self.assertFalse(any(self.is_snapshot(f) for f in frames))
+        self.assertEqual(self.game.resume(5), [])
+
+    def test_resume_too_far_behind_gets_keyframe(self):
+        self.tick(8)
+        self.game._snapshot = None  # as if something changed since
+        frames = self.game.resume(1)
+        self.assertEqual(self.event_ids(frames), [6, 7, 8])
+        self.assertTrue(self.is_snapshot(frames[0]))
+
+    def test_resume_unknown_event_gets_snapshot(self):
+        self.tick(2)
+        frames = self.game.resume(17)
+        self.assertEqual(self.event_ids(frames), [2])
+        self.assertTrue(self.is_snapshot(frames[0]))
+
+    def test_resume_from_another_game_gets_snapshot(self):
+        game = Game("game", json.loads(json.dumps(GAME_DATA)), epoch=1000)
+        game.queues.add(Queue())
+        for _ in range(3):
+            game.broadcast({"patch": []})
+        self.assertEqual(self.event_ids(game.resume(1001)), [1002, 1003])
+        frames = game.resume(2)  # an id from an earlier game
+        self.assertEqual(len(frames), 1)
+        self.assertTrue(self.is_snapshot(frames[0]))
+
+
+class GameScheduleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game("game", json.loads(json.dumps(GAME_DATA)),
+                         period=1.0, max_catch_up=3)
+        self.game.queues.add(Queue())  # so that the game keeps running
+        self.game._deadline = 10.0
+
+    def test_step_on_schedule(self):
+        self.assertEqual(self.game.step(now=10.25), 11.0)
+        self.assertEqual(self.game.stats.ticks, 1)
+        self.assertEqual(self.game.stats.lag, 0.25)
+        self.assertEqual(self.game.step(now=11.0), 12.0)  # no drift
+        self.assertEqual(self.game.stats.skipped, 0)
+
+    def test_step_catches_up(self):
+        self.assertEqual(self.game.step(now=11.5), 12.0)
+        self.assertEqual(self.game.stats.ticks, 2)
+        self.assertEqual(self.game.stats.max_lag, 1.5)
+        self.assertEqual(self.game.stats.skipped, 0)
+
+    def test_step_catches_up_to_a_limit(self):
+        self.assertEqual(self.game.step(now=15.5), 16.0)
+        self.assertEqual(self.game.stats.ticks, 3)
+        self.assertEqual(self.game.stats.skipped, 3)
+
+    def test_step_skips(self):
+        self.game.policy = SKIP
+        self.assertEqual(self.game.step(now=12.5), 13.0)
+        self.assertEqual(self.game.stats.ticks, 1)
+        self.assertEqual(self.game.stats.skipped, 2)
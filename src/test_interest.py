@@ -0,0 +1,76 @@
+import unittest
+
+from interest import View
+from level import Level, Room, Connection
+
+
+class ViewTestCase(unittest.TestCase):
+
+    """
+    Rooms in a row: A - B | C - D, with a closed door between B and C.
+    The hero is in A, and sees A and B.
+    """
+
+    def setUp(self):
+        self.rooms = dict((_id, Room(_id)) for _id in "ABCD")
+        self.level = Level("level", self.rooms.values(), [
+            Connection("1", rooms=["A", "B"]),
+            Connection("2", door=True, opened=False, rooms=["B", "C"]),
+            Connection("3", door=True, rooms=["C", "D"]),
+        ])
+        self.level.add_entities([
+            {"_id": "hero", "is_hero": True, "room": "A"},
+            {"_id": "near", "is_hero": False, "room": "B"},
+            {"_id": "far", "is_hero": False, "room": "D"},
+        ])
+        self.view = View(self.level, "hero")
+        self.level.journal.flush()
+
+    def flush(self):
+        return self.view.filter(*self.level.journal.flush(with_masks=True))
+
+    def test_snapshot_has_visible_entities_only(self):
+        self.assertIn('"near"', self.view.snapshot())
+        self.assertNotIn('"far"', self.view.snapshot())
+
+    def test_changes_out_of_sight_are_filtered(self):
+        self.level.toggle_door("3")
+        self.level.entities["far"].damage(1)
+        self.assertListEqual(self.flush(), [])
+
+    def test_changes_in_sight_are_kept(self):
+        self.level.toggle_door("2")
+        self.assertListEqual(self.flush(), [
+            dict(op="replace", path="/connections/2/opened", value=True)])
+
+    def test_entities_coming_into_sight_are_added(self):
+        far = self.level.entities["far"]
+        far._path.append((self.rooms["B"], self.level.connections["2"], 1))
+        far.enter_room()
+        patch = self.flush()
+        self.assertEqual(len(patch), 1)
+        self.assertEqual(patch[0]["op"], "add")
+        self.assertEqual(patch[0]["path"], "/entities/far")
+        self.assertEqual(patch[0]["value"]["room"], "B")
+
+    def test_entities_going_out_of_sight_are_removed(self):
+        self.level.toggle_door("2")
+        self.flush()
+        near = self.level.entities["near"]
+        near._path.append((self.rooms["C"], self.level.connections["2"], 1))
+        near.enter_room()
+        self.assertListEqual(self.flush(), [dict(op="remove", path="/entities/near")])
+
+    def test_doors_coming_into_sight_are_updated(self):
+        self.level.toggle_door("3")  # closed out of sight
+        self.flush()
+        hero = self.level.entities["hero"]
+        hero._path.append((self.rooms["B"], self.level.connections["1"], 1))
+        hero.enter_room()
+        self.flush()
+        self.level.toggle_door("2")  # now C can be seen, and its doors
+        self.assertItemsEqual(self.flush(), [
+            dict(op="replace", path="/connections/2/opened", value=True),
+            dict(op="replace", path="/connections/2/locked", value=False),
+            dict(op="replace", path="/connections/3/opened", value=False),
+            dict(op="replace", path="/connections/3/locked", value=False)])
@@ -0,0 +1,87 @@
+import unittest
+
+from journal import Journal
+from level import Level, Room, Connection
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = Journal()
+
+    def test_flush_returns_ops_in_order(self):
+        self.journal.replace("/a/1/x", 1)
+        self.journal.add("/a/2", {"x": 2})
+        self.assertListEqual(self.journal.flush(), [
+            dict(op="replace", path="/a/1/x", value=1),
+            dict(op="add", path="/a/2", value={"x": 2})])
+        self.assertEqual(len(self.journal), 0)
+
+    def test_only_last_change_is_kept(self):
+        self.journal.replace("/a/1/x", 1)
+        self.journal.replace("/a/2/x", 2)
+        self.journal.replace("/a/1/x", 3)
+        self.assertListEqual(self.journal.flush(), [
+            dict(op="replace", path="/a/2/x", value=2),
+            dict(op="replace", path="/a/1/x", value=3)])
+
+    def test_remove_drops_pending_changes(self):
+        self.journal.replace("/a/1/x", 1)
+        self.journal.replace("/a/11/x", 1)
+        self.journal.remove("/a/1")
+        self.assertListEqual(self.journal.flush(), [
+            dict(op="replace", path="/a/11/x", value=1),
+            dict(op="remove", path="/a/1")])
+
+    def test_remove_after_add_cancels_out(self):
+        self.journal.add("/a/1", {"x": 1})
+        self.journal.replace("/a/1/x", 2)
+        self.journal.remove("/a/1")
+        self.assertListEqual(self.journal.flush(), [])
+
+    def test_remove_after_readding_is_kept(self):
+        self.journal.remove("/a/1")
+        self.journal.add("/a/1", {"x": 1})
+        self.journal.remove("/a/1")
+        self.assertListEqual(self.journal.flush(), [dict(op="remove", path="/a/1")])
+        self.journal.add("/a/1", {"x": 1})
+        self.journal.remove("/a/1")
+        self.assertListEqual(self.journal.flush(), [])
+
+
+class LevelJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rooms = [Room("A"), Room("B")]
+        self.door = Connection("1", door=True, rooms=["A", "B"])
+        self.level = Level("level", self.rooms, [self.door])
+        self.level.add_entities([{"_id": "hero", "is_hero": True, "room": "A"}])
+
+    def test_new_entities_are_recorded(self):
+        ops = self.level.journal.flush()
+        self.assertEqual(len(ops), 1)
+        self.assertEqual(ops[0]["op"], "add")
+        self.assertEqual(ops[0]["path"], "/entities/hero")
+        self.assertEqual(ops[0]["value"]["room"], "A")
+
+    def test_door_changes_are_recorded(self):
+        self.level.journal.flush()
+        self.level.toggle_door("1")
+        self.assertListEqual(self.level.journal.flush(), [
+            dict(op="replace", path="/connections/1/opened", value=False)])
+
+    def test_entity_changes_are_recorded(self):
+        self.level.journal.flush()
+        hero = self.level.entities["hero"]
+        hero.set_destination(self.level, self.rooms[1])
+        hero.damage(10)
+        hero.state = "MOVING"
+        self.assertListEqual(self.level.journal.flush(), [
+            dict(op="replace", path="/entities/hero/path", value=[("B", "1", 1)]),
+            dict(op="replace", path="/entities/hero/health", value=90),
+            dict(op="replace", path="/entities/hero/state", value="MOVING")])
+
+    def test_quiet_update_records_nothing(self):
+        self.level.journal.flush()
+        self.level.update_entities()
+        self.assertListEqual(self.level.journal.flush(), [])
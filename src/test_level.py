@@ -1,6 +1,10 @@
 import unittest
 
-from level import Level, Room, Connection
+import mock
+
+from clock import VirtualClock
+from entity import Hero
+from level import Level, LevelTemplate, Room, Connection
 
 
 ROOM_A = Room("A", [])
@@ -31,12 +35,201 @@ class LevelTestCase(unittest.TestCase):
         self.assertItemsEqual(conn, expected)
 
     def test_get_connected_rooms_after_closing_door(self):
+        door = Connection("6", door=True, opened=True, rooms=["C", "E"])
+        level = Level(rooms=[ROOM_A, ROOM_B, ROOM_C, ROOM_D, ROOM_E],
+                      connections=[DOOR_2, DOOR_3, door])
+        self.assertIn((ROOM_E, door), level.get_connected_rooms(ROOM_C))
+        level.toggle_door("6")
         expected = set([(ROOM_A, DOOR_3), (ROOM_B, DOOR_2)])
-        conn = self.level.get_connected_rooms(ROOM_C)
-        self.assertItemsEqual(conn, expected)
+        self.assertItemsEqual(level.get_connected_rooms(ROOM_C), expected)
+        self.assertItemsEqual(level.get_connected_rooms(ROOM_E), [])
+
+    def test_get_connected_rooms_after_opening_door(self):
+        door = Connection("7", door=True, opened=False, rooms=["B", "E"])
+        level = Level(rooms=[ROOM_A, ROOM_B, ROOM_C, ROOM_D, ROOM_E],
+                      connections=[DOOR_1, door])
+        self.assertItemsEqual(level.get_connected_rooms("E"), [])
+        level.toggle_door("7")
+        self.assertItemsEqual(level.get_connected_rooms("E"), [(ROOM_B, door)])
 
     #@unittest.skip("")
     def test_get_shortest_path(self):
         expected = [(ROOM_A, DOOR_1, 1), (ROOM_D, DOOR_4, 1)]
         path = self.level.get_shortest_path(ROOM_B, ROOM_D)
         self.assertListEqual(path, expected)
+
+    def test_get_entities_by_room(self):
+        self.level.add_entities([{"_id": "hero", "is_hero": True, "room": "A"},
+                                 {"_id": "monster", "is_hero": False, "room": "A"}])
+        hero, monster = self.level.entities["hero"], self.level.entities["monster"]
+        self.assertItemsEqual(self.level.get_entities(ROOM_A), [hero, monster])
+        self.assertListEqual(self.level.get_heroes(ROOM_A), [hero])
+        self.assertListEqual(self.level.get_monsters(ROOM_A), [monster])
+        self.assertListEqual(self.level.get_entities(ROOM_B), [])
+
+    def test_get_entities_after_moving_and_dying(self):
+        self.level.add_entities([{"_id": "monster", "is_hero": False, "room": "A"}])
+        monster = self.level.entities["monster"]
+        monster._path.append((ROOM_B, DOOR_1, 1))
+        monster.enter_room()
+        self.assertListEqual(self.level.get_monsters(ROOM_A), [])
+        self.assertListEqual(self.level.get_monsters(ROOM_B), [monster])
+        monster.state = "DEAD"
+        self.level.reap_entities()
+        self.assertListEqual(self.level.get_entities(ROOM_B), [])
+        self.assertNotIn("monster", self.level.entities)
+
+    def test_get_shortest_path_unreachable(self):
+        self.assertIsNone(self.level.get_shortest_path(ROOM_B, ROOM_E))
+
+    def test_shortest_path_follows_door_changes(self):
+        door = Connection("8", door=True, opened=False, rooms=["B", "D"])
+        level = Level(rooms=[ROOM_A, ROOM_B, ROOM_C, ROOM_D, ROOM_E],
+                      connections=[DOOR_1, DOOR_2, DOOR_3, DOOR_4, door])
+        self.assertEqual(len(level.get_shortest_path(ROOM_B, ROOM_D)), 2)
+        level.toggle_door("8")  # opening gives a shortcut
+        self.assertListEqual(level.get_shortest_path(ROOM_B, ROOM_D),
+                             [(ROOM_D, door, 1)])
+        level.toggle_door("8")  # and closing takes it away again
+        self.assertListEqual(level.get_shortest_path(ROOM_B, ROOM_D),
+                             [(ROOM_A, DOOR_1, 1), (ROOM_D, DOOR_4, 1)])
+
+
+class UpdateTestCase(unittest.TestCase):
+
+    "Entities are only updated when they're due."
+
+    def setUp(self):
+        self.clock = VirtualClock(100.0)
+        self.level = Level(rooms=[Room("A"), Room("B")],
+                           connections=[Connection("1", rooms=["A", "B"])], clock=self.clock)
+        self.level.add_entities([{"_id": "hero", "is_hero": True, "room": "A"}])
+        self.hero = self.level.entities["hero"]
+        self.update = mock.patch.object(Hero, "update", autospec=True,
+                                        side_effect=Hero.update)
+        self.level.update_entities()  # new entities are updated once
+
+    def update_entities(self):
+        "Update the level, returning the number of heroes updated."
+        with self.update as update:
+            self.level.update_entities()
+            return update.call_count
+
+    def test_idle_entity_sleeps(self):
+        self.assertEqual(self.update_entities(), 0)
+
+    def test_moving_entity_wakes_when_arriving(self):
+        self.hero.set_destination(self.level, self.level.rooms["B"])
+        self.assertEqual(self.update_entities(), 1)
+        self.assertEqual(self.hero.state, "MOVING")
+        self.assertEqual(self.update_entities(), 0)
+        self.clock.now = self.hero._timeout
+        self.assertEqual(self.update_entities(), 1)
+        self.assertEqual(self.hero.room._id, "B")
+        self.assertEqual(self.hero.state, "IDLE")
+
+    def test_entity_woken_by_enemy(self):
+        self.level.add_entities([{"_id": "monster", "is_hero": False, "room": "A",
+                                  "restlessness": 0}])
+        self.assertEqual(self.update_entities(), 1)
+        self.assertEqual(self.hero.state, "FIGHTING")
+
+
+class LevelTemplateTestCase(unittest.TestCase):
+
+    "Levels made from the same template share what doesn't change."
+
+    def setUp(self):
+        self.template = LevelTemplate.from_dict({
+            "_id": "level",
+            "rooms": {"A": {"items": ["key"]}, "B": {}, "C": {}},
+            "connections": {"1": {"door": True, "rooms": ["A", "B"]},
+                            "2": {"rooms": ["B", "C"]}},
+            "entities": [{"_id": "hero", "is_hero": True, "room": "A"}]
+        })
+        self.level1, self.level2 = self.template.create(), self.template.create()
+
+    def test_levels_share_the_template(self):
+        self.assertIs(self.level1.template, self.level2.template)
+        self.assertEqual(self.level1.to_dict(), self.level2.to_dict())
+        self.assertIs(self.level1.rooms["A"].items, self.level2.rooms["A"].items)
+
+    def test_levels_change_separately(self):
+        self.level1.toggle_door("1")
+        self.level1.rooms["A"].items = []
+        self.level1.entities["hero"].set_destination(self.level1, self.level1.rooms["C"])
+        self.assertIsNone(self.level1.get_shortest_path(self.level1.rooms["A"],
+                                                        self.level1.rooms["C"]))
+        self.assertEqual(len(self.level2.get_shortest_path(self.level2.rooms["A"],
+                                                           self.level2.rooms["C"])), 2)
+        self.assertEqual(self.level2.rooms["A"].items, ["key"])
+        self.assertTrue(self.level2.connections["1"].opened)
+        self.assertFalse(self.level2.entities["hero"]._path)
+
+
+def make_rect(x, y, width=10, height=10):
+    return {"x": x, "y": y, "width": width, "height": height}
+
+
+class WeightedLevelTestCase(unittest.TestCase):
+
+    """
+    Rooms on a line, A-B-C-D, where the D end is stretched out. There's also
+    a long way around from A to D through E.
+    """
+
+    def setUp(self):
+        self.rooms = [Room(_id, [], rect=make_rect(x, 0))
+                      for _id, x in [("A", 0), ("B", 20), ("C", 40), ("D", 100), ("E", 50)]]
+        self.level = Level(
+            rooms=self.rooms,
+            connections=[
+                Connection("1", rooms=["A", "B"], rect=make_rect(10, 0)),
+                Connection("2", rooms=["B", "C"], rect=make_rect(30, 0)),
+                Connection("3", door=True, rooms=["C", "D"], rect=make_rect(70, 0)),
+                Connection("4", rooms=["A", "E"], rect=make_rect(0, 400)),
+                Connection("5", rooms=["E", "D"], rect=make_rect(100, 400)),
+            ],
+            weighted=True)
+
+    def test_weighted_path_prefers_shortest_distance(self):
+        path = self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        self.assertEqual([(room._id, conn._id) for room, conn, _ in path],
+                         [("B", "1"), ("C", "2"), ("D", "3")])
+
+    def test_weighted_path_distances(self):
+        path = self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        distances = [dist for _, _, dist in path]
+        self.assertAlmostEqual(distances[0], distances[1])
+        self.assertAlmostEqual(distances[2], 3 * distances[0])
+        self.assertAlmostEqual(distances[0],
+                               self.level.get_step_distance(self.rooms[0], path[0][1]))
+
+    def test_weighted_path_after_closing_door(self):
+        self.level.toggle_door("3")
+        path = self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        self.assertEqual([room._id for room, _, _ in path], ["E", "D"])
+        self.level.toggle_door("5")  # not a door, stays open
+        self.assertEqual(len(self.level.get_shortest_path(self.rooms[0], self.rooms[3])), 2)
+
+    def test_weighted_routes_are_cached(self):
+        self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        self.assertIn("D", self.level._routes)
+        self.level.toggle_door("3")
+        self.assertNotIn("D", self.level._routes)
+        self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        self.level.toggle_door("3")  # makes a route shorter again
+        self.assertNotIn("D", self.level._routes)
+
+    def test_weighted_path_without_routing(self):
+        self.level.routing = False
+        path = self.level.get_shortest_path(self.rooms[0], self.rooms[3])
+        self.level.routing = True
+        self.assertEqual(path, self.level.get_shortest_path(self.rooms[0], self.rooms[3]))
+
+    def test_weighted_path_to_same_room(self):
+        self.assertEqual(self.level.get_shortest_path(self.rooms[0], self.rooms[0]), [])
+
+    def test_weighted_level_needs_geometry(self):
+        self.assertRaises(ValueError, Level, rooms=[ROOM_A, ROOM_B],
+                          connections=[DOOR_1], weighted=True)
@@ -0,0 +1,72 @@
+import unittest
+
+from mock import patch
+
+from listener import Listener, encode_event, decode_event, merge_patches
+
+
+def patch_frame(event_id, *ops):
+    return encode_event({"patch": list(ops)}, event_id)
+
+
+def replace(path, value):
+    return dict(op="replace", path=path, value=value)
+
+
+class MergePatchesTestCase(unittest.TestCase):
+
+    def test_merge_keeps_last_change(self):
+        merged = merge_patches([[replace("/a/x", 1), replace("/b/x", 1)],
+                                [replace("/a/x", 2)]])
+        self.assertListEqual(merged, [replace("/b/x", 1), replace("/a/x", 2)])
+
+    def test_merge_cancels_add_and_remove(self):
+        merged = merge_patches([[dict(op="add", path="/a", value={})],
+                                [replace("/a/x", 2)],
+                                [dict(op="remove", path="/a")]])
+        self.assertListEqual(merged, [])
+
+
+class ListenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = encode_event({"data": {}}, 100)
+        self.listener = Listener(lambda: self.snapshot, max_pending=3, max_behind=6,
+                                 drop_after=10.0)
+
+    def test_frames_come_out_in_order(self):
+        frames = [patch_frame(i, replace("/a/x", i)) for i in range(3)]
+        for frame in frames:
+            self.listener.put(frame)
+        self.assertEqual(self.listener.lag[0], 3)
+        self.assertListEqual([self.listener.get() for _ in range(3)], frames)
+        self.assertEqual(self.listener.lag, (0, 0.0))
+
+    def test_patches_are_merged_when_behind(self):
+        self.listener.put(encode_event({"data": {}}, 0))
+        for i in range(1, 6):
+            self.listener.put(patch_frame(i, replace("/a/x", i), replace("/b/%d" % i, i)))
+        self.assertEqual(len(self.listener), 2)
+        self.assertEqual(self.listener.lag[0], 6)
+        self.assertIn('"data"', self.listener.get())
+        event_id, data = decode_event(self.listener.get())
+        self.assertEqual(event_id, 5)
+        self.assertListEqual(data["patch"], [replace("/b/1", 1), replace("/b/2", 2),
+                                             replace("/b/3", 3), replace("/b/4", 4),
+                                             replace("/a/x", 5), replace("/b/5", 5)])
+
+    def test_snapshot_when_far_behind(self):
+        for i in range(7):
+            self.listener.put(patch_frame(i, replace("/a/x", i)))
+        self.assertEqual(len(self.listener), 1)
+        self.assertEqual(self.listener.get(), self.snapshot)
+        self.assertEqual(self.listener.lag[0], 0)
+
+    def test_stalled_listener_is_dropped(self):
+        with patch("time.time") as mock_time:
+            mock_time.return_value = self.listener._last_read + 11
+            for i in range(4):
+                self.listener.put(patch_frame(i, replace("/a/x", i)))
+        self.assertTrue(self.listener.dropped)
+        self.assertEqual(len(self.listener), 0)
+        self.assertIsNone(self.listener.get())
@@ -0,0 +1,62 @@
+import json
+import unittest
+
+from game import Game
+from listener import Listener
+from metrics import Histogram, render
+from test_game import GAME_DATA
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = Histogram((1, 2, 5))
+        for value in [0.5, 1, 1.5, 3, 100]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.sum, 106)
+        self.assertEqual(histogram.count, 5)
+
+    def test_add(self):
+        histogram = Histogram((1, 2))
+        other = Histogram((1, 2))
+        histogram.observe(1)
+        other.observe(3)
+        histogram.add(other)
+        self.assertEqual(histogram.counts, [1, 0, 1])
+
+
+class RenderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game(1, json.loads(json.dumps(GAME_DATA)))
+        self.game.queues.add(Listener())
+        self.game.toggle_door("1")
+        self.game._deadline = 10.0
+        self.game.step(10.0)
+        self.lines = render([self.game]).splitlines()
+
+    def test_timings_are_recorded(self):
+        self.assertIn('controlroom_phase_seconds_count{game="1",phase="tick"} 1', self.lines)
+        self.assertIn('controlroom_phase_seconds_count{game="1",phase="entities"} 1',
+                      self.lines)
+        self.assertIn('controlroom_patch_ops_bucket{game="1",le="1"} 1', self.lines)
+        self.assertIn('controlroom_events_total{game="1"} 1', self.lines)
+
+    def test_gauges_are_read_off_the_game(self):
+        self.assertIn('controlroom_entities{game="1"} 1', self.lines)
+        self.assertIn('controlroom_listeners{game="1",kind="json"} 1', self.lines)
+        self.assertIn('controlroom_queue_depth{game="1"} 1', self.lines)
+
+    def test_process_totals(self):
+        other = Game(2, json.loads(json.dumps(GAME_DATA)))
+        other.queues.add(Listener())
+        other._deadline = 10.0
+        other.step(10.0)
+        lines = render([self.game, other]).splitlines()
+        self.assertIn('controlroom_phase_seconds_count{game="all",phase="tick"} 2', lines)
+        self.assertIn('controlroom_listeners{game="all",kind="json"} 2', lines)
+        self.assertIn('controlroom_games 2', lines)
+
+    def test_only_games_with_metrics(self):
+        self.assertIn('controlroom_games 0', render([object()]).splitlines())
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch, Mock, PropertyMock
+
+from clock import VirtualClock
+from game import Game
+from listener import decode_event
+from recording import Recorder, Replay
+
+
+GAME_DATA = {
+    "_id": "level",
+    "rooms": {"A": {}, "B": {}, "C": {}},
+    "connections": {"1": {"door": True, "rooms": ["A", "B"]},
+                    "2": {"door": False, "rooms": ["B", "C"]}},
+    "entities": [{"_id": "hero", "is_hero": True, "room": "A"}] + [
+        {"_id": "monster%d" % i, "is_hero": False, "room": "C"} for i in range(3)]
+}
+
+
+class RecordingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "game.rec")
+        self.game = Game("game", json.loads(json.dumps(GAME_DATA)), period=0.5,
+                         clock=VirtualClock(), seed=1)
+        self.game.level.spawn_probability = 0.2
+        self.game.level.max_entities = 10
+        self.game.record(self.path, snapshot_interval=10)
+        self.states = {0: self.state()}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def state(self):
+        return json.loads(json.dumps(self.game.level.to_dict()))
+
+    def play(self, ticks):
+        for _ in range(ticks):
+            self.game.simulate(1)
+            self.states[self.game.stats.ticks] = self.state()
+        self.game.recorder.close()
+
+    def test_replay_any_tick(self):
+        self.play(35)
+        replay = Replay(self.path)
+        self.assertEqual(len(replay.snapshots), 4)
+        for tick in (0, 1, 9, 10, 11, 23, 35):
+            self.assertEqual(replay.state(tick), self.states[tick])
+
+    def test_replay_right_away(self):
+        self.assertEqual(Replay(self.path).state(0), self.states[0])
+
+    def test_closed_while_stopped(self):
+        self.game.simulate(5)
+        self.game.stop()
+        self.assertTrue(self.game.recorder.closed)
+        self.game.scheduler = Mock()  # don't really run it
+        self.game.run()
+        self.assertFalse(self.game.recorder.closed)
+        self.states[5] = self.state()
+        self.play(5)
+        self.assertEqual(Replay(self.path).state(10), self.states[10])
+
+    def test_snapshots_on_quiet_ticks(self):
+        self.game.recorder.close()
+        recorder = Recorder(self.path, self.game.level, snapshot_interval=10, interval=60)
+        closed = {"op": "replace", "path": "/connections/1/opened", "value": False}
+        for tick in range(25):  # nothing happens at ticks 10 and 20
+            changes = {3: [closed], 15: [dict(closed, value=True)]}.get(tick, [])
+            recorder.tick(tick, [], changes)
+        recorder.close()
+        replay = Replay(self.path)
+        self.assertEqual([tick for tick, _, _ in replay.snapshots], [0, 10, 20])
+        self.assertFalse(replay.state(14)["connections"]["1"]["opened"])
+        self.assertTrue(replay.state(20)["connections"]["1"]["opened"])
+
+    def test_commands_are_recorded(self):
+        with patch.object(Game, "is_running", new_callable=PropertyMock, return_value=True):
+            self.game.toggle_door("1", callback=lambda result: None)
+            self.game.move_entity("hero", "B", callback=lambda result: None)
+            self.play(1)
+        tick, commands, ops = list(Replay(self.path).events(0))[1]
+        self.assertEqual(tick, 0)
+        self.assertEqual(commands, [("toggle_door", ["1"]), ("move_entity", ["hero", "B"])])
+        self.assertIn({"op": "replace", "path": "/connections/1/opened", "value": False}, ops)
+
+    def test_stream(self):
+        self.play(15)
+        with patch("gevent.sleep") as sleep:
+            frames = list(Replay(self.path).stream(start=12, speed=2.0))
+        event_id, data = decode_event(frames[0])
+        self.assertEqual((event_id, data), (12, {"data": self.states[12]}))
+        self.assertEqual(decode_event(frames[-1])[0], 15)
+        self.assertEqual(sum(args[0] for args, _ in sleep.call_args_list), 0.5)
+
+    def test_stream_needs_a_positive_speed(self):
+        self.play(1)
+        self.assertRaises(ValueError, next, Replay(self.path).stream(speed=0))
+
+    def test_unfinished_recording(self):
+        self.play(5)
+        with open(self.path, "ab") as f:
+            f.write("T\x05\x00")  # half a header
+        self.assertEqual(Replay(self.path).state(5), self.states[5])
@@ -0,0 +1,70 @@
+import unittest
+
+from mock import Mock
+
+from scheduler import GameScheduler
+
+
+class GameSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = GameScheduler(max_ticks=2)
+        self.scheduler._main = Mock()  # don't start the main loop
+        self.games = [Mock(period=1.0) for _ in range(3)]
+        for game in self.games:
+            self.scheduler.add(game)
+            game.step.side_effect = self._step(game)
+
+    def _step(self, game):
+        def step(now):
+            game._deadline += game.period
+        return step
+
+    def test_games_are_spread_out(self):
+        deadlines = sorted(game._deadline % 1.0 for game in self.games)
+        for a, b in zip(deadlines, deadlines[1:]):
+            self.assertGreater(b - a, 0.2)
+
+    def test_run_due_games_only(self):
+        first = min(self.games, key=lambda g: g._deadline)
+        self.assertEqual(self.scheduler.run_due(now=first._deadline), 1)
+        first.step.assert_called_with(first._deadline - 1.0)
+
+    def test_run_due_limit(self):
+        now = max(game._deadline for game in self.games)
+        self.assertEqual(self.scheduler.run_due(now), 2)
+        self.assertEqual(self.scheduler.run_due(now), 1)
+        self.assertEqual(self.scheduler.run_due(now), 0)
+
+    def test_removed_games_are_not_run(self):
+        self.scheduler.remove(self.games[0])
+        now = max(game._deadline for game in self.games)
+        self.assertEqual(self.scheduler.run_due(now) + self.scheduler.run_due(now), 2)
+        self.assertEqual(self.games[0].step.call_count, 0)
+        self.assertNotIn(self.games[0], self.scheduler)
+
+    def test_readded_games_are_run_once(self):
+        game = self.games[0]
+        self.scheduler.remove(game)
+        self.scheduler.add(game)
+        now = max(g._deadline for g in self.games)
+        for _ in range(3):
+            self.scheduler.run_due(now)
+        self.assertEqual(game.step.call_count, 1)
+
+    def test_failing_game_is_removed(self):
+        failing = self.games[0]
+        failing.step.side_effect = ValueError("broken")
+        now = max(g._deadline for g in self.games)
+        self.assertEqual(self.scheduler.run_due(now) + self.scheduler.run_due(now), 3)
+        self.assertNotIn(failing, self.scheduler)
+        self.assertTrue(failing.log.log.called)
+        others = self.games[1:]
+        self.scheduler.run_due(now + 1.0)
+        self.assertEqual([game.step.call_count for game in others], [2, 2])
+
+    def test_failed_callback(self):
+        self.scheduler.failed = Mock()
+        self.games[0].step.side_effect = ValueError("broken")
+        self.scheduler.run_due(max(g._deadline for g in self.games))
+        self.scheduler.failed.assert_called_once_with(self.games[0])
@@ -0,0 +1,143 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import gevent
+from mock import Mock
+
+from shards import ShardPool, ShardError, RemoteGame, drop_game
+from game import Game
+from test_game import GAME_DATA
+
+
+# Logging from a worker, in a process that's monkey patched like the server
+MONKEY_PATCHED_LOGGING = """
+import sys
+import gevent.monkey
+gevent.monkey.patch_all()
+import gevent
+from shards import ShardPool, ShardError
+from test_game import GAME_DATA
+
+pool = ShardPool(1, log_path=sys.argv[1])
+pool.create_game(1, GAME_DATA, period=0.01)
+try:
+    pool.request(1, "explode")
+except ShardError:
+    pass
+for _ in range(30):
+    gevent.sleep(0.1)
+    if "explode failed" in open(sys.argv[1] % 0).read():
+        sys.exit(0)
+sys.exit(1)
+"""
+
+
+class ShardPoolTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.pool = ShardPool(2, log_path=os.path.join(cls.directory, "events.%d.log"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_games_are_spread_over_shards(self):
+        shards = set(self.pool.shard(game_id) for game_id in range(10))
+        self.assertEqual(shards, set([0, 1]))
+
+    def test_commands_and_frames(self):
+        game = self.pool.create_game(1, GAME_DATA, period=0.01)
+        listener = game.listen()
+        self.assertIn('data: {"data": ', next(listener))
+        self.assertTrue(game.toggle_door("1"))
+        self.assertIn('"/connections/1/opened"', next(listener))
+        self.assertIsNone(game.move_entity("nobody", "B"))
+        listener.close()
+
+    def test_failed_commands_are_answered(self):
+        game = self.pool.create_game(2, GAME_DATA, period=0.01)
+        self.assertRaises(ShardError, game.toggle_door, [1])
+        self.assertRaises(ShardError, self.pool.request, 2, "explode")
+        results = []
+        game.toggle_door([1], callback=results.append)
+        self.assertTrue(game.toggle_door("1"))  # the worker is still there
+        self.assertEqual(results, [None])
+
+    def test_workers_log_to_their_own_files(self):
+        self.pool.create_game(3, GAME_DATA)
+        self.assertRaises(ShardError, self.pool.request, 3, "explode")
+        path = os.path.join(self.directory, "events.%d.log" % self.pool.shard(3))
+        for _ in range(50):  # until the worker has written it out
+            if os.path.exists(path) and "explode failed" in open(path).read():
+                break
+            gevent.sleep(0.1)
+        else:
+            self.fail("Nothing logged to %s" % path)
+
+    def test_workers_log_when_monkey_patched(self):
+        path = os.path.join(self.directory, "patched.%d.log")
+        self.assertEqual(subprocess.call([sys.executable, "-c", MONKEY_PATCHED_LOGGING, path],
+                                         cwd=os.path.dirname(os.path.abspath(__file__))), 0)
+
+
+class RemoteGameTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = Mock()
+        self.game = RemoteGame(self.pool, 1)
+
+    def start_listening(self):
+        """
+        Start a listener, returning it, the greenlet waiting for its first
+        frame, and the callback for the worker's reply.
+        """
+        listener = self.game.listen()
+        greenlet = gevent.spawn(next, listener)
+        gevent.sleep(0)
+        return listener, greenlet, self.pool.request.call_args[1]["callback"]
+
+    def test_listener_leaving_before_subscribed(self):
+        _, greenlet, subscribed = self.start_listening()
+        greenlet.kill()
+        self.assertFalse(self.pool.send.called)  # still waiting for the worker
+        subscribed(["frame"])
+        self.assertEqual(self.game.queues, set())
+        self.pool.send.assert_called_once_with(1, "unlisten")
+
+    def test_last_listener_leaving_while_another_joins(self):
+        first, greenlet, subscribed = self.start_listening()
+        subscribed(["frame 1"])
+        greenlet.join()
+        _, greenlet, subscribed = self.start_listening()
+        first.close()
+        self.assertFalse(self.pool.send.called)
+        subscribed(["frame 2"])
+        self.assertEqual(greenlet.get(timeout=1), "frame 2")
+
+    def test_failed_game_lets_listeners_go(self):
+        listener, greenlet, subscribed = self.start_listening()
+        subscribed(["frame"])
+        greenlet.join()
+        self.game.failed()
+        self.assertEqual(list(listener), [])
+        self.assertEqual(self.game.queues, set())
+
+
+class DropGameTestCase(unittest.TestCase):
+
+    def test_waiting_commands_are_answered(self):
+        conn = Mock()
+        game = Game("game", GAME_DATA)
+        games = {"game": game}
+        results = []
+        game.commands.put("toggle_door", ("1",), results.append)
+        drop_game(conn, games, game)
+        self.assertEqual(results, [None])
+        self.assertEqual(games, {})
+        conn.send.assert_called_once_with(("failed", "game", None))
@@ -0,0 +1,71 @@
+import unittest
+
+from level import Level, Room
+from entity import Hero, Monster
+from store import EntityStore, HERO, MONSTER, numpy
+
+
+@unittest.skipIf(numpy is None, "needs NumPy")
+class EntityStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.level = Level("level", [Room("A"), Room("B")], [], store=True)
+        self.store = self.level.store
+        self.hero = Hero("hero", self.level, self.level.rooms["A"],
+                         chance_to_hit=1.0, weapon_damage=3)
+        self.monster = Monster(_id="monster", level=self.level, room=self.level.rooms["A"],
+                               chance_to_hit=1.0, weapon_damage=5)
+        self.level.place_entity(self.hero)
+        self.level.place_entity(self.monster)
+        self.level.journal.flush()
+
+    def test_stats_live_in_the_store(self):
+        self.hero.health = 50
+        self.assertEqual(self.store.columns["health"][self.hero._slot], 50)
+        self.assertEqual(self.hero.health, 50)
+        self.level.remove_entity(self.hero)
+        self.assertIsNone(self.hero._store)
+        self.assertEqual(self.hero.health, 50)
+        self.assertEqual(len(self.store), 1)
+
+    def test_rows_are_reused(self):
+        self.level.remove_entity(self.monster)
+        other = Monster(_id="other", level=self.level, room=self.level.rooms["B"])
+        self.level.place_entity(other)
+        self.assertEqual(other._slot, 1)
+        self.assertEqual(self.store.room[1], self.store.room_numbers["B"])
+
+    def test_store_grows(self):
+        store = EntityStore(["A"], capacity=1)
+        for i in range(5):
+            store.add(Monster(_id=str(i), room=self.level.rooms["A"]), MONSTER)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(list(store.side[:5]), [MONSTER] * 5)
+        self.assertEqual(list(store.room[:5]), [0] * 5)
+
+    def test_fighting(self):
+        self.store.set_fighting(self.hero, True)
+        self.store.set_fighting(self.monster, True)
+        damaged = self.store.fight(now=10.0)
+        self.assertEqual(set(damaged), set([self.hero, self.monster]))
+        self.assertEqual(self.hero.health, 95)
+        self.assertEqual(self.monster.health, 97)
+        self.assertEqual(self.store.fight(now=10.5), [])  # cooling down
+        self.assertEqual(len(self.store.fight(now=11.0)), 2)
+
+    def test_no_fighting_without_enemies_in_the_room(self):
+        self.store.set_fighting(self.hero, True)
+        self.store.set_fighting(self.monster, True)
+        old_room, self.monster.room = self.monster.room, self.level.rooms["B"]
+        self.level.move_entity(self.monster, old_room)
+        self.assertEqual(self.store.fight(now=10.0), [])
+
+    def test_hero_health_is_journaled(self):
+        self.store.set_fighting(self.monster, True)
+        self.level.update_entities()
+        self.assertIn({"op": "replace", "path": "/entities/hero/health", "value": 95.0},
+                      self.level.journal.flush())
+
+    def test_sides(self):
+        self.assertEqual(self.store.side[self.hero._slot], HERO)
+        self.assertEqual(self.store.side[self.monster._slot], MONSTER)
@@ -0,0 +1,61 @@
+import json
+import unittest
+
+from level import Level, Room, Connection
+from wire import CompactEncoder, CompactDecoder, pack_varint, unpack_varint
+
+
+class VarintTestCase(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for n in [0, 1, 127, 128, 300, 2 ** 40]:
+            out = bytearray()
+            pack_varint(n, out)
+            self.assertEqual(unpack_varint(out, 0), (n, len(out)))
+
+
+class CompactTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.level = Level("level", [Room("A"), Room("B")],
+                           [Connection("1", door=True, rooms=["A", "B"])])
+        self.level.add_entities([{"_id": "hero", "is_hero": True, "room": "A"}])
+        self.level.journal.flush()
+        self.encoder = CompactEncoder(self.level)
+        snapshot = self.encoder.snapshot(1)
+        self.data = json.loads(snapshot.split("data: ", 1)[1])
+        self.decoder = CompactDecoder(self.data["ids"])
+
+    def roundtrip(self, ops):
+        frame = self.encoder.patch(ops, 2)
+        return self.decoder.decode(frame.split("data: ", 1)[1].strip())
+
+    def test_snapshot_has_state_and_ids(self):
+        self.assertEqual(self.data["data"], self.level.to_dict())
+        self.assertEqual(self.data["ids"]["entities"], ["hero"])
+
+    def test_patch_roundtrip(self):
+        hero = self.level.entities["hero"]
+        hero.set_destination(self.level, self.level.rooms["B"])
+        hero.damage(10)
+        hero.state = "MOVING"
+        self.level.toggle_door("1")
+        self.level.rooms["B"].items = ["ammo"]
+        ops = json.loads(json.dumps(self.level.journal.flush()))
+        self.assertListEqual(self.roundtrip(ops), ops)
+
+    def test_new_and_removed_entities(self):
+        self.level.add_entities([{"_id": "monster", "is_hero": False, "room": "B"}])
+        ops = json.loads(json.dumps(self.level.journal.flush()))
+        self.assertListEqual(self.roundtrip(ops), ops)
+        self.level.remove_entity(self.level.entities["monster"])
+        ops = self.level.journal.flush()
+        self.assertListEqual(self.roundtrip(ops), ops)
+
+    def test_patch_is_smaller(self):
+        hero = self.level.entities["hero"]
+        hero.set_destination(self.level, self.level.rooms["B"])
+        hero.state = "MOVING"
+        ops = self.level.journal.flush()
+        compact = self.encoder.patch(ops, 2)
+        self.assertLess(len(compact), len(json.dumps({"patch": ops})) / 2)
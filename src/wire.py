@@ -0,0 +1,201 @@
+"""
+A compact encoding of game events, as an alternative to JSON patches.
+
+Rooms, connections and entities are given small integer ids, which are
+announced in the first (JSON) snapshot as lists, where the position of
+an id is its number. Patches are then sent as packed binary operations,
+base64 encoded to fit in a server-sent event:
+
+  header: 1 byte, operation << 2 | kind
+  index:  varint, the number of the room/connection/entity
+  field:  1 byte, see FIELDS (WHOLE for adding an entity)
+  value:  depends on the field, see CompactEncoder.encode_value
+
+Entities that are added later get the next free number, and the client
+learns their id from the "_id" of the added value. Numbers aren't reused.
+
+Compact patches aren't merged for clients that fall behind (see
+listener.py); they get a new snapshot instead, once far enough behind.
+
+> encoder = CompactEncoder(level)
+> encoder.snapshot(event_id)  # frame with the full state and the ids
+> encoder.patch(ops, event_id)  # frame with the changes
+"""
+
+from base64 import b64encode, b64decode
+import json
+import struct
+
+
+OPS = ["add", "replace", "remove"]
+KINDS = ["rooms", "connections", "entities"]
+FIELDS = ["health", "room", "path", "state", "opened", "locked", "items"]
+WHOLE = 255  # the field code used for the whole thing, e.g. when added
+STATES = ["IDLE", "MOVING", "FIGHTING", "DEAD"]
+
+FLOAT = struct.Struct("<f")
+
+
+def pack_varint(n, out):
+    "Append a non-negative integer to a bytearray, 7 bits at a time."
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def unpack_varint(data, pos):
+    "Read an integer written by pack_varint. Returns it, and the new position."
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+class Interner(object):
+
+    "Hands out numbers for ids, in order."
+
+    def __init__(self, ids=()):
+        self.ids = []
+        self.numbers = {}
+        for _id in ids:
+            self.get(_id)
+
+    def get(self, _id):
+        number = self.numbers.get(_id)
+        if number is None:
+            number = self.numbers[_id] = len(self.ids)
+            self.ids.append(_id)
+        return number
+
+
+class CompactEncoder(object):
+
+    "Encodes the events of one level. Shared by all compact clients of a game."
+
+    def __init__(self, level):
+        self.level = level
+        self.interners = dict(rooms=Interner(level.rooms),
+                              connections=Interner(level.connections),
+                              entities=Interner(level.entities))
+
+    def ids(self):
+        "The ids of everything, in the order of their numbers."
+        return dict((kind, interner.ids) for kind, interner in self.interners.items())
+
+    def snapshot(self, event_id, entities=None):
+        "The full state, with the ids, as a frame. Stays JSON since it's rare."
+        for _id in self.level.entities:
+            self.interners["entities"].get(_id)
+        data = {"data": self.level.to_dict(entities), "ids": self.ids()}
+        return "id: %d\ndata: %s\n\n" % (event_id, json.dumps(data))
+
+    def patch(self, ops, event_id):
+        "A list of patch operations, packed, as a frame."
+        out = bytearray()
+        for op in ops:
+            self.encode_op(op, out)
+        return "id: %d\ndata: %s\n\n" % (event_id, b64encode(out))
+
+    def encode_op(self, op, out):
+        parts = op["path"].split("/")  # e.g. ["", "entities", "hero", "health"]
+        kind = parts[1]
+        out.append(OPS.index(op["op"]) << 2 | KINDS.index(kind))
+        pack_varint(self.interners[kind].get(parts[2]), out)
+        field = parts[3] if len(parts) > 3 else None
+        if op["op"] == "remove":
+            out.append(WHOLE if field is None else FIELDS.index(field))
+        else:
+            self.encode_value(field, op["value"], out)
+
+    def encode_value(self, field, value, out):
+        "Append a field code and a value, packed as tightly as we know how."
+        if field == "health":
+            out.append(0)
+            out.extend(FLOAT.pack(value))
+        elif field == "room":
+            out.append(1)
+            pack_varint(self.interners["rooms"].get(value), out)
+        elif field == "path":
+            out.append(2)
+            pack_varint(len(value), out)
+            for room, conn, dist in value:
+                pack_varint(self.interners["rooms"].get(room), out)
+                pack_varint(self.interners["connections"].get(conn), out)
+                out.extend(FLOAT.pack(dist))
+        elif field == "state" and value in STATES:
+            out.append(3)
+            out.append(STATES.index(value))
+        elif field in ("opened", "locked"):
+            out.append(FIELDS.index(field))
+            out.append(1 if value else 0)
+        else:  # anything else goes as JSON
+            out.append(WHOLE if field is None else FIELDS.index(field) | 0x80)
+            blob = json.dumps(value)
+            pack_varint(len(blob), out)
+            out.extend(blob)
+
+
+class CompactDecoder(object):
+
+    "Turns compact frames back into JSON patch operations, given the ids."
+
+    def __init__(self, ids):
+        self.ids = dict((kind, list(ids[kind])) for kind in KINDS)
+
+    def decode(self, data):
+        "Decode the base64 data of a frame into a list of patch operations."
+        data = bytearray(b64decode(data))
+        ops, pos = [], 0
+        while pos < len(data):
+            op, pos = self.decode_op(data, pos)
+            ops.append(op)
+        return ops
+
+    def decode_op(self, data, pos):
+        header = data[pos]
+        op, kind = OPS[header >> 2], KINDS[header & 3]
+        number, pos = unpack_varint(data, pos + 1)
+        field = data[pos]
+        pos += 1
+        value = None
+        if op != "remove":
+            value, pos = self.decode_value(field, data, pos)
+        ids = self.ids[kind]
+        if number == len(ids):  # a newcomer
+            ids.append(value["_id"])
+        path = "/%s/%s" % (kind, ids[number])
+        if field != WHOLE:
+            path += "/" + FIELDS[field & 0x7f]
+        result = dict(op=op, path=path)
+        if op != "remove":
+            result["value"] = value
+        return result, pos
+
+    def decode_value(self, field, data, pos):
+        if field == 0:
+            return FLOAT.unpack_from(buffer(data), pos)[0], pos + 4
+        if field == 1:
+            number, pos = unpack_varint(data, pos)
+            return self.ids["rooms"][number], pos
+        if field == 2:
+            count, pos = unpack_varint(data, pos)
+            path = []
+            for _ in range(count):
+                room, pos = unpack_varint(data, pos)
+                conn, pos = unpack_varint(data, pos)
+                dist = FLOAT.unpack_from(buffer(data), pos)[0]
+                pos += 4
+                path.append([self.ids["rooms"][room], self.ids["connections"][conn], dist])
+            return path, pos
+        if field == 3:
+            return STATES[data[pos]], pos + 1
+        if field in (4, 5):
+            return bool(data[pos]), pos + 1
+        length, pos = unpack_varint(data, pos)
+        return json.loads(str(data[pos:pos + length])), pos + length